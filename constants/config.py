@@ -22,5 +22,9 @@ class AccountConfig:
     KEY = os.environ.get("KEY")
 
 
+class CrawlerConfig:
+    DATA_PATH = os.getenv("CRAWLER_DATA_PATH", ".data/")
+
+
 class MonitoringConfig:
     MONITOR_ROOT_PATH = os.getenv("MONITOR_ROOT_PATH", "/home/monitor/.log/")
@@ -1,5 +1,73 @@
+from constants.twitter import Tweets, Follow, FollowBuckets, TwitterUser, TimeSeries, CrawlTasks
+
+
 class MongoCollection:
     tweets = "tweets"
     twitter_users = "twitter_users"
     twitter_follows = "twitter_follows"
+    twitter_follow_buckets = "twitter_follow_buckets"
+    twitter_user_count_logs = "twitter_user_count_logs"
+    tweet_impression_logs = "tweet_impression_logs"
+    crawl_tasks = "crawl_tasks"
     configs = "configs"
+
+
+class MongoIndexes:
+    # {collection: [(name, keys, options)]}, created by MongoDB.apply_indexes
+    specs = {
+        MongoCollection.tweets: [
+            ("author_timestamp", [(Tweets.author, 1), (Tweets.timestamp, -1)], {}),
+        ],
+        MongoCollection.twitter_users: [
+            ("userName", [(TwitterUser.user_name, 1)], {}),
+        ],
+        MongoCollection.twitter_follows: [
+            ("to_from", [(Follow.to, 1), (Follow.from_, 1)], {}),
+        ],
+        MongoCollection.twitter_follow_buckets: [
+            ("project_minId", [(FollowBuckets.project, 1), (FollowBuckets.min_id, 1)], {}),
+        ],
+        MongoCollection.twitter_user_count_logs: [
+            ("key_bucket", [(TimeSeries.key, 1), (TimeSeries.bucket, 1)], {}),
+        ],
+        MongoCollection.tweet_impression_logs: [
+            ("key_bucket", [(TimeSeries.key, 1), (TimeSeries.bucket, 1)], {}),
+        ],
+        MongoCollection.crawl_tasks: [
+            # Same order as the sort of MongoTaskQueue.claim
+            ("priority_nextDueAt", [(CrawlTasks.priority, -1), (CrawlTasks.next_due_at, 1)], {}),
+        ],
+    }
+
+    # TTL indexes replacing remove_out_date_docs, {collection: (name, date field)}.
+    # expireAfterSeconds is the retention given at startup
+    ttl = {
+        MongoCollection.twitter_user_count_logs: ("lastUpdatedDate_ttl", TimeSeries.last_updated_date),
+        MongoCollection.tweet_impression_logs: ("lastUpdatedDate_ttl", TimeSeries.last_updated_date),
+    }
+
+    # Common queries that must be served by an index, {collection: [(filter, sort)]}
+    queries = {
+        MongoCollection.tweets: [
+            ({Tweets.author: "0", Tweets.timestamp: {"$gte": 0}}, [(Tweets.timestamp, -1)]),
+        ],
+        MongoCollection.twitter_users: [
+            ({TwitterUser.user_name: ""}, None),
+        ],
+        MongoCollection.twitter_follows: [
+            ({Follow.to: "0"}, None),
+            ({Follow.to: "0", Follow.from_: "0"}, None),
+        ],
+        MongoCollection.twitter_follow_buckets: [
+            ({FollowBuckets.project: "0", FollowBuckets.min_id: {"$lte": 0}}, [(FollowBuckets.min_id, -1)]),
+        ],
+        MongoCollection.twitter_user_count_logs: [
+            ({TimeSeries.key: "0", TimeSeries.bucket: {"$gte": 0, "$lte": 0}}, None),
+        ],
+        MongoCollection.tweet_impression_logs: [
+            ({TimeSeries.key: "0", TimeSeries.bucket: {"$gte": 0, "$lte": 0}}, None),
+        ],
+        MongoCollection.crawl_tasks: [
+            ({CrawlTasks.next_due_at: {"$lte": 0}}, [(CrawlTasks.priority, -1), (CrawlTasks.next_due_at, 1)]),
+        ],
+    }
@@ -36,6 +36,8 @@ class Tweets:
     retweet_counts = "retweetCounts"
     retweeted_tweet = "retweetedTweet"
     quoted_tweet = "quotedTweet"
+    retweeted_tweet_id = "retweetedTweetId"
+    quoted_tweet_id = "quotedTweetId"
     text = "text"
     tweet_body = "tweetBody"
     url = "url"
@@ -44,13 +46,96 @@ class Tweets:
     impression_logs = "impressionLogs"
 
 
+class TimeSeries:
+    id_ = "_id"
+    key = "key"
+    bucket = "bucket"
+    logs = "logs"
+    last_updated_at = "lastUpdatedAt"
+    last_updated_date = "lastUpdatedDate"
+
+
 class Follow:
     id_ = "_id"
     from_ = "from"
     to = "to"
+    unfollowed_at = "unfollowedAt"
+
+
+class FollowBuckets:
+    id_ = "_id"
+    project = "project"
+    index = "index"
+    min_id = "minId"
+    max_id = "maxId"
+    count = "count"
+    ids = "ids"
+    last_updated_at = "lastUpdatedAt"
+
+
+class TwitterAccount:
+    config_key = "twitter_accounts"
+    accounts = "accounts"
+    username = "username"
+    password = "password"
+    email = "email"
+    email_password = "emailPassword"
+
+
+class CrawlTasks:
+    id_ = "_id"
+    project = "project"
+    stream_type = "streamType"
+    priority = "priority"
+    next_due_at = "nextDueAt"
+    lease_owner = "leaseOwner"
+    lease_expiry = "leaseExpiry"
+    attempts = "attempts"
+    last_error = "lastError"
+
+
+class RawPages:
+    fetched_at = "fetchedAt"
+    user_id = "userId"
+    response = "response"
+
+
+class TwitterHandles:
+    id_ = "_id"
+    handle = "handle"
+    user_id = "userId"
+    last_updated_at = "lastUpdatedAt"
 
 
 class Projects:
     mapping = {
         "trava": "trava_finance"
     }
+
+
+class Endpoints:
+    followers = "followers"
+    user_tweets = "user_tweets"
+    user_by_login = "user_by_login"
+
+
+class RateLimits:
+    # Items per second and burst size of each endpoint, shared by all crawling coroutines
+    budgets = {
+        Endpoints.followers: (50, 1000),
+        Endpoints.user_tweets: (100, 1000),
+        Endpoints.user_by_login: (1, 5),
+    }
+
+
+class CrawlStates:
+    id_ = "_id"
+    stream_type = "streamType"
+    user_id = "userId"
+    latest_tweet_id = "latestTweetId"
+    latest_timestamp = "latestTimestamp"
+    pending_tweet_id = "pendingTweetId"
+    pending_timestamp = "pendingTimestamp"
+    cursor = "cursor"
+    completed_at = "completedAt"
+    last_updated_at = "lastUpdatedAt"
@@ -0,0 +1,200 @@
+import asyncio
+import threading
+import time
+
+from databases.change_detector import ChangeDetector
+from databases.mongodb import MongoDB
+from utils.logger_utils import get_logger
+from utils.metrics_utils import QUEUE_DEPTH
+
+logger = get_logger('Buffered Mongo Sink')
+
+
+class BufferedMongoSink:
+    """
+    Write-behind buffer in front of MongoDB.update_docs.
+    Documents are grouped per collection and written by a background thread once a collection
+    reaches batch_size documents or flush_interval seconds passed since its oldest buffered document.
+    """
+
+    def __init__(self, exporter: MongoDB, batch_size=1000, flush_interval=5, max_buffered=100000,
+                 change_detector: ChangeDetector = None):
+        """
+        Args:
+            * exporter: MongoDB used to write batches
+            * batch_size: number of buffered documents of a collection that triggers a flush
+            * flush_interval: max seconds a document stays in the buffer
+            * max_buffered: add() blocks while more documents than this are waiting to be written
+            * change_detector: if set, documents that did not change since their last write are dropped
+        """
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.change_detector = change_detector
+
+        self._buffers = {}
+        # Per collection, [epoch, count] runs of the buffered documents in add order
+        self._buffer_epochs = {}
+        self._first_buffered_at = {}
+        # Every flush() starts a new epoch and waits only for the documents of the epochs before
+        self._epoch = 0
+        # {epoch: number of its documents buffered or being written}
+        self._pending = {}
+        self._n_buffered = 0
+        self._n_writing = 0
+        # Number of flush() calls waiting, the worker writes partial batches right away while it is set
+        self._flush_requests = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._worker = None
+
+        self.stats = {"buffered": 0, "written": 0, "batches": 0, "failed": 0}
+
+    def start(self):
+        if self._worker is None:
+            self._closed = False
+            self._worker = threading.Thread(target=self._run, name='mongo-sink', daemon=True)
+            self._worker.start()
+        return self
+
+    def add(self, collection_name, docs, block=True):
+        """Buffer docs, blocks the calling thread while the sink is full unless block is False"""
+        if self.change_detector is not None and docs:
+            docs = self.change_detector.filter_changed(collection_name, docs)
+        if not docs:
+            return
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('Sink is closed')
+            while block and self._is_full():
+                self._condition.wait()
+            buffer = self._buffers.setdefault(collection_name, [])
+            if not buffer:
+                self._first_buffered_at[collection_name] = time.time()
+            buffer.extend(docs)
+            runs = self._buffer_epochs.setdefault(collection_name, [])
+            if runs and runs[-1][0] == self._epoch:
+                runs[-1][1] += len(docs)
+            else:
+                runs.append([self._epoch, len(docs)])
+            self._pending[self._epoch] = self._pending.get(self._epoch, 0) + len(docs)
+            self._n_buffered += len(docs)
+            self.stats["buffered"] += len(docs)
+            QUEUE_DEPTH.labels('mongo_sink').set(self._n_buffered + self._n_writing)
+            if len(buffer) >= self.batch_size:
+                self._condition.notify_all()
+
+    async def put(self, collection_name, docs):
+        """add() for coroutines, waits for room in a thread so the event loop keeps running"""
+        while self._is_full() and not self._closed:
+            await asyncio.to_thread(self._wait_for_room)
+        # No other coroutine runs between the check and add()
+        self.add(collection_name, docs, block=False)
+
+    def _is_full(self):
+        return self._n_buffered + self._n_writing >= self.max_buffered
+
+    def _wait_for_room(self):
+        with self._condition:
+            while self._is_full() and not self._closed:
+                self._condition.wait()
+
+    def flush(self):
+        """Block until every document added so far has been written, documents added meanwhile are not waited for"""
+        with self._condition:
+            epoch = self._epoch
+            self._epoch += 1
+            self._flush_requests += 1
+            try:
+                self._condition.notify_all()
+                while any(pending_epoch <= epoch for pending_epoch in self._pending):
+                    if self._worker is None or not self._worker.is_alive():
+                        break
+                    self._condition.wait(timeout=self.flush_interval)
+            finally:
+                self._flush_requests -= 1
+        if self._worker is None or not self._worker.is_alive():
+            with self._condition:
+                batches = self._take_batches(force=True)
+            self._write(batches)
+
+    def close(self):
+        """Drain the buffers and stop the background thread"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        with self._condition:
+            batches = self._take_batches(force=True)
+        self._write(batches)
+        logger.info(f"Sink closed, wrote {self.stats['written']} docs in {self.stats['batches']} batches")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                batches = self._take_batches(force=self._closed or self._flush_requests > 0)
+                if not batches:
+                    if self._closed:
+                        return
+                    self._condition.wait(timeout=self._get_wait_time())
+                    continue
+            self._write(batches)
+
+    def _get_wait_time(self):
+        if not self._first_buffered_at:
+            return self.flush_interval
+        oldest = min(self._first_buffered_at.values())
+        return max(oldest + self.flush_interval - time.time(), 0.01)
+
+    def _take_batches(self, force=False):
+        # Must be called while holding self._condition
+        now = time.time()
+        batches = []
+        for collection_name, buffer in self._buffers.items():
+            if not buffer:
+                continue
+            if force or len(buffer) >= self.batch_size or \
+                    now - self._first_buffered_at[collection_name] >= self.flush_interval:
+                batches.append((collection_name, buffer, self._buffer_epochs.pop(collection_name)))
+
+        for collection_name, buffer, _ in batches:
+            self._buffers[collection_name] = []
+            self._first_buffered_at.pop(collection_name, None)
+            self._n_buffered -= len(buffer)
+            self._n_writing += len(buffer)
+        return batches
+
+    def _write(self, batches):
+        for collection_name, docs, runs in batches:
+            try:
+                for i in range(0, len(docs), self.batch_size):
+                    batch = docs[i:i + self.batch_size]
+                    try:
+                        self.exporter.update_docs(collection_name, batch, raise_errors=True)
+                    except Exception as ex:
+                        # Unwritten docs keep no fingerprint, so the next run writes them again
+                        self.stats["failed"] += len(batch)
+                        logger.exception(f"Failed to write {len(batch)} docs to {collection_name}: {ex}")
+                        continue
+                    if self.change_detector is not None:
+                        self.change_detector.commit(collection_name, batch)
+                    self.stats["batches"] += 1
+                    self.stats["written"] += len(batch)
+            finally:
+                with self._condition:
+                    self._n_writing -= len(docs)
+                    for epoch, count in runs:
+                        self._pending[epoch] -= count
+                        if not self._pending[epoch]:
+                            del self._pending[epoch]
+                    QUEUE_DEPTH.labels('mongo_sink').set(self._n_buffered + self._n_writing)
+                    self._condition.notify_all()
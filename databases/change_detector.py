@@ -0,0 +1,115 @@
+import dbm
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from utils.logger_utils import get_logger
+
+logger = get_logger('Change Detector')
+
+FINGERPRINT = "fingerprint"
+
+
+def get_fingerprint(doc: dict) -> str:
+    """Stable hash of a converted document"""
+    content = {key: value for key, value in doc.items() if key != FINGERPRINT}
+    data = json.dumps(content, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
+
+class FingerprintCache:
+    """
+    LRU of document fingerprints, optionally backed by a dbm file so it survives restarts.
+    Thread safe: fingerprints are read by the crawler and set by the sink thread once written.
+    """
+
+    def __init__(self, max_size=1000000, path=None):
+        self.max_size = max_size
+        self._lru = OrderedDict()
+        self._db = dbm.open(path, 'c') if path else None
+        self._lock = threading.RLock()
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        fingerprint = self._lru.get(key)
+        if fingerprint is not None:
+            self._lru.move_to_end(key)
+            return fingerprint
+        if self._db is not None:
+            value = self._db.get(key)
+            if value is not None:
+                fingerprint = value.decode()
+                self._remember(key, fingerprint)
+        return fingerprint
+
+    def set(self, key, fingerprint):
+        with self._lock:
+            self._remember(key, fingerprint)
+            if self._db is not None:
+                self._db[key] = fingerprint
+
+    def _remember(self, key, fingerprint):
+        self._lru[key] = fingerprint
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def sync(self):
+        with self._lock:
+            if self._db is not None and hasattr(self._db, 'sync'):
+                self._db.sync()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class ChangeDetector:
+    """Drops documents whose content did not change since they were last written"""
+
+    def __init__(self, cache: FingerprintCache, collections):
+        """
+        Args:
+            * cache: fingerprints of the documents already written
+            * collections: names of the collections whose documents are checked
+        """
+        self.cache = cache
+        self.collections = set(collections)
+        self.stats = {"checked": 0, "skipped": 0}
+
+    def filter_changed(self, collection_name, docs: list) -> list:
+        """Docs that changed, with their fingerprint set. It is only remembered once commit() is called"""
+        if collection_name not in self.collections:
+            return docs
+        changed = []
+        for doc in docs:
+            key = f'{collection_name}:{doc["_id"]}'
+            fingerprint = get_fingerprint(doc)
+            self.stats["checked"] += 1
+            if self.cache.get(key) == fingerprint:
+                self.stats["skipped"] += 1
+                continue
+            doc[FINGERPRINT] = fingerprint
+            changed.append(doc)
+        return changed
+
+    def commit(self, collection_name, docs: list):
+        """Remember the fingerprints of docs that were written successfully"""
+        if collection_name not in self.collections:
+            return
+        for doc in docs:
+            fingerprint = doc.get(FINGERPRINT)
+            if fingerprint is not None:
+                self.cache.set(f'{collection_name}:{doc["_id"]}', fingerprint)
+
+    def log_stats(self):
+        logger.info(f"Skipped {self.stats['skipped']}/{self.stats['checked']} unchanged documents")
+
+    def close(self):
+        self.cache.close()
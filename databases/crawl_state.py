@@ -0,0 +1,30 @@
+import time
+
+from constants.mongo_constant import MongoCollection
+from constants.twitter import CrawlStates
+from databases.mongodb import MongoDB
+
+
+class CrawlState:
+    """Per (stream type, user) crawl progress kept in the configs collection"""
+
+    def __init__(self, exporter: MongoDB, collection_name=MongoCollection.configs):
+        self.exporter = exporter
+        self.collection_name = collection_name
+
+    @staticmethod
+    def get_key(stream_type, user_id):
+        return f"crawl_state_{stream_type}_{user_id}"
+
+    def get(self, stream_type, user_id) -> dict:
+        return self.exporter.get_doc(self.collection_name, key=self.get_key(stream_type, user_id)) or {}
+
+    def update(self, stream_type, user_id, values: dict):
+        doc = {
+            CrawlStates.id_: self.get_key(stream_type, user_id),
+            CrawlStates.stream_type: stream_type,
+            CrawlStates.user_id: str(user_id),
+            CrawlStates.last_updated_at: int(time.time()),
+            **values
+        }
+        self.exporter.update_docs(self.collection_name, [doc], flatten=False)
@@ -0,0 +1,81 @@
+import bisect
+import time
+from array import array
+
+from pymongo import ReplaceOne
+
+from constants.mongo_constant import MongoCollection
+from constants.twitter import FollowBuckets
+from databases.mongodb import MongoDB
+
+
+class FollowBucketStore:
+    """
+    Follower ids of a project packed as sorted int64 arrays into bucket documents of at most bucket_size ids:
+    {_id: "<project>_<index>", project, index, minId, maxId, count, ids: <packed int64>, lastUpdatedAt}
+    """
+
+    def __init__(self, exporter: MongoDB, bucket_size=50000, collection_name=MongoCollection.twitter_follow_buckets):
+        self.exporter = exporter
+        self.bucket_size = bucket_size
+        self.collection = exporter.mongo_db[collection_name]
+
+    def save(self, project, ids):
+        """Replace the followers of project with ids"""
+        ids = array('q', sorted(ids))
+        now = int(time.time())
+        operations = []
+        for index, start in enumerate(range(0, len(ids), self.bucket_size)):
+            bucket = ids[start:start + self.bucket_size]
+            operations.append(ReplaceOne({FollowBuckets.id_: f'{project}_{index}'}, {
+                FollowBuckets.project: str(project),
+                FollowBuckets.index: index,
+                FollowBuckets.min_id: bucket[0],
+                FollowBuckets.max_id: bucket[-1],
+                FollowBuckets.count: len(bucket),
+                FollowBuckets.ids: bucket.tobytes(),
+                FollowBuckets.last_updated_at: now,
+            }, upsert=True))
+        if operations:
+            self.exporter.bulk_write(self.collection, operations)
+        # Drop the buckets left over from a larger follower set
+        self.collection.delete_many({
+            FollowBuckets.project: str(project),
+            FollowBuckets.index: {"$gte": len(operations)}
+        })
+
+    def add(self, project, ids):
+        """Add ids to the stored followers of project"""
+        self.save(project, self.load(project) | set(ids))
+
+    def iter_followers(self, project):
+        """Yield the follower ids of project in ascending order"""
+        cursor = self.collection.find(
+            {FollowBuckets.project: str(project)}, projection=[FollowBuckets.ids],
+            sort=[(FollowBuckets.min_id, 1)], batch_size=1)
+        for doc in cursor:
+            yield from self._unpack(doc)
+
+    def load(self, project) -> set:
+        return set(self.iter_followers(project))
+
+    def is_follower(self, project, user_id) -> bool:
+        user_id = int(user_id)
+        doc = self.collection.find_one(
+            {FollowBuckets.project: str(project), FollowBuckets.min_id: {"$lte": user_id}},
+            projection=[FollowBuckets.ids, FollowBuckets.max_id], sort=[(FollowBuckets.min_id, -1)])
+        if doc is None or doc[FollowBuckets.max_id] < user_id:
+            return False
+        ids = self._unpack(doc)
+        i = bisect.bisect_left(ids, user_id)
+        return i < len(ids) and ids[i] == user_id
+
+    def count(self, project) -> int:
+        docs = self.collection.find({FollowBuckets.project: str(project)}, projection=[FollowBuckets.count])
+        return sum(doc[FollowBuckets.count] for doc in docs)
+
+    @staticmethod
+    def _unpack(doc) -> array:
+        ids = array('q')
+        ids.frombytes(doc[FollowBuckets.ids])
+        return ids
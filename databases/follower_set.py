@@ -0,0 +1,39 @@
+import os
+import pathlib
+from array import array
+
+
+class FollowerSetStore:
+    """Per-project follower ids kept on disk as sorted int64 arrays"""
+
+    def __init__(self, root_path):
+        self.root_path = root_path
+        pathlib.Path(root_path).mkdir(parents=True, exist_ok=True)
+
+    def get_path(self, project, partial=False):
+        suffix = '.partial.bin' if partial else '.bin'
+        return os.path.join(self.root_path, f'{project}{suffix}')
+
+    def exists(self, project, partial=False):
+        return os.path.isfile(self.get_path(project, partial))
+
+    def load(self, project, partial=False) -> set:
+        path = self.get_path(project, partial)
+        if not os.path.isfile(path):
+            return set()
+        ids = array('q')
+        with open(path, 'rb') as file:
+            ids.frombytes(file.read())
+        return set(ids)
+
+    def save(self, project, ids, partial=False):
+        path = self.get_path(project, partial)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            array('q', sorted(ids)).tofile(file)
+        os.replace(tmp_path, path)
+
+    def discard_partial(self, project):
+        path = self.get_path(project, partial=True)
+        if os.path.isfile(path):
+            os.remove(path)
@@ -1,9 +1,13 @@
 import sys
-from pymongo import MongoClient, UpdateOne
+import time
+
+from pymongo import MongoClient, UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 from constants.config import MongoDBConfig
 from utils.dict_utils import flatten_dict, delete_none
 from utils.logger_utils import get_logger
+from utils.metrics_utils import MONGO_BULK_WRITE_OPS, MONGO_BULK_WRITE_SECONDS
 
 logger = get_logger('MongoDB')
 
@@ -21,6 +25,9 @@ class MongoDB:
             logger.exception(f"Failed to connect to ArangoDB: {connection_url}: {e}")
             sys.exit(1)
 
+        # Field-level updates produced by create_update_doc vs UpdateOne actually sent
+        self.write_stats = {"field_ops": 0, "planned_ops": 0}
+
     def get_docs(self, collection, keys: list = None, filter_: dict = None, batch_size=1000,
                  projection=None):  # change filter_ to obj
 
@@ -68,8 +75,10 @@ class MongoDB:
             filter=filter_statement, projection=projection_statement, batch_size=batch_size)
         return cursor
 
-    def update_docs(self, collection_name, data, keep_none=False, merge=True, shard_key=None, flatten=True):
-        """If merge is set to True => sub-dictionaries are merged instead of overwritten"""
+    def update_docs(self, collection_name, data, keep_none=False, merge=True, shard_key=None, flatten=True,
+                    raise_errors=False):
+        """If merge is set to True => sub-dictionaries are merged instead of overwritten.
+        Write errors are logged, or raised if raise_errors is set"""
         try:
             col = self.mongo_db[collection_name]
             # col.insert_many(data, overwrite=True, overwrite_mode='update', keep_none=keep_none, merge=merge)
@@ -79,46 +88,33 @@ class MongoDB:
                     bulk_operations = [UpdateOne({"_id": item["_id"]}, {"$set": item}, upsert=True) for item in data]
                 else:
                     bulk_operations = [UpdateOne({"_id": item["_id"], shard_key: item[shard_key]}, {"$set": item}, upsert=True) for item in data]
-                col.bulk_write(bulk_operations)
+                self.bulk_write(col, bulk_operations)
                 return
             
+            keys = ["_id", shard_key] if shard_key else ["_id"]
             for document in data:
-                unset, set_, add_to_set = self.create_update_doc(document, keep_none, merge, shard_key)
-                if not shard_key:
-                    bulk_operations += [
-                        UpdateOne({"_id": item["_id"]},
-                                  {"$unset": {key: value for key, value in item.items() if key != "_id"}}, upsert=True)
-                        for item in unset]
-                    bulk_operations += [
-                        UpdateOne({"_id": item["_id"]},
-                                  {"$set": {key: value for key, value in item.items() if key != "_id"}}, upsert=True)
-                        for item in set_]
-                    bulk_operations += [
-                        UpdateOne({"_id": item["_id"]},
-                                  {"$addToSet": {key: value for key, value in item.items() if key != "_id"}},
-                                  upsert=True)
-                        for item in add_to_set]
-                if shard_key:
-                    keys = ["_id", shard_key]
-                    bulk_operations += [
-                        UpdateOne({"_id": item["_id"], shard_key: item[shard_key]},
-                                  {"$unset": {key: value for key, value in item.items() if key not in keys}},
-                                  upsert=True)
-                        for item in unset]
-                    bulk_operations += [
-                        UpdateOne({"_id": item["_id"], shard_key: item[shard_key]},
-                                  {"$set": {key: value for key, value in item.items() if key not in keys}}, upsert=True)
-                        for item in set_]
-                    bulk_operations += [
-                        UpdateOne({"_id": item["_id"], shard_key: item[shard_key]},
-                                  {"$addToSet": {key: value for key, value in item.items() if key not in keys}},
-                                  upsert=True)
-                        for item in add_to_set]
-            col.bulk_write(bulk_operations)
+                fields = [field for field in self.get_update_fields(document, keep_none, merge) if field[1] not in keys]
+                updates = self.plan_update_doc(fields)
+                filter_statement = {key: document[key] for key in keys}
+                bulk_operations += [UpdateOne(filter_statement, update, upsert=True) for update in updates]
+                self.write_stats["field_ops"] += len(fields)
+            self.write_stats["planned_ops"] += len(bulk_operations)
+            if not bulk_operations:
+                return
+            self.bulk_write(col, bulk_operations)
         except Exception as ex:
+            if raise_errors:
+                raise
             logger.exception(ex)
 
+    @staticmethod
+    def bulk_write(col, bulk_operations):
+        with MONGO_BULK_WRITE_SECONDS.labels(col.name).time():
+            col.bulk_write(bulk_operations)
+        MONGO_BULK_WRITE_OPS.labels(col.name).inc(len(bulk_operations))
+
     def remove_out_date_docs(self, collection_name, timestamp, filter_: dict = None):  # change filter to dict
+        # Scans lastUpdatedAt, collections with a TTL index in MongoIndexes.ttl expire by themselves
         filter_statement = {
             "lastUpdatedAt": {"$lt": timestamp}
         }
@@ -175,6 +171,122 @@ class MongoDB:
 
         return unset, set_, add_to_set
 
+    @staticmethod
+    def get_update_fields(document, keep_none=False, merge=True) -> list:
+        """
+        (operator, path, value) updates of create_update_doc, built in a single pass over the document.
+        Paths are walked like flatten_dict, the last value wins for paths repeated by lists of dicts.
+        """
+        fields = []
+        if not keep_none:
+            repeated = False
+            stack = [("", document)]
+            while stack:
+                prefix, current = stack.pop()
+                nested = []
+                for key, value in current.items():
+                    if type(key) is not str:
+                        key = str(key)
+                        repeated = True
+                    path = prefix + key
+                    if isinstance(value, dict):
+                        nested.append((path + '.', value))
+                        continue
+                    if isinstance(value, list):
+                        array = []
+                        for item in value:
+                            if isinstance(item, dict):
+                                nested.append((path + '.', item))
+                                repeated = True
+                            else:
+                                array.append(item)
+                        if not array:
+                            continue
+                        value = {"$each": [i for i in array if i]}
+                        # Without merge only the unsets are kept, other fields stay as placeholders until deduplicated
+                        fields.append(("$addToSet" if merge else None, path, value))
+                    elif value is None:
+                        fields.append(("$unset", path, ""))
+                    else:
+                        fields.append(("$set" if merge else None, path, value))
+                if nested:
+                    # Reversed so sub-dictionaries are handled in document order
+                    nested.reverse()
+                    stack += nested
+            if repeated:
+                fields = list({field[1]: field for field in fields}.values())
+            if not merge:
+                fields = [field for field in fields if field[0] is not None]
+
+        if not merge:
+            doc = document if keep_none else delete_none(document)
+            fields += [("$set", key, value) for key, value in doc.items()]
+        return fields
+
+    @staticmethod
+    def plan_update_doc(fields):
+        """Merge the (operator, path, value) updates of one document into as few update statements as possible.
+
+        A new statement is only started when a path conflicts (same path or parent/child path)
+        with one already planned, since MongoDB rejects such updates.
+        """
+        updates = []
+        for operator, key, value in fields:
+            key_prefixes = get_path_prefixes(key) if '.' in key else ()
+            for update, paths, prefixes in updates:
+                if not has_path_conflict(key, paths, prefixes, key_prefixes):
+                    break
+            else:
+                update, paths, prefixes = {}, set(), set()
+                updates.append((update, paths, prefixes))
+            update.setdefault(operator, {})[key] = value
+            paths.add(key)
+            prefixes.update(key_prefixes)
+
+        return [update for update, _, _ in updates]
+
+    def acquire_lease(self, collection_name, key, owner, ttl) -> bool:
+        """Take or renew the lease on key for ttl seconds, False if another owner holds it"""
+        now = int(time.time())
+        filter_statement = {
+            "_id": key,
+            "$or": [{"leaseOwner": owner}, {"leaseExpiry": {"$lt": now}}, {"leaseExpiry": {"$exists": False}}]
+        }
+        try:
+            doc = self.mongo_db[collection_name].find_one_and_update(
+                filter_statement, {"$set": {"leaseOwner": owner, "leaseExpiry": now + ttl}},
+                upsert=True, return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError:
+            # Document exists but the lease belongs to someone else
+            return False
+        return doc is not None
+
+    def release_lease(self, collection_name, key, owner):
+        self.mongo_db[collection_name].update_one(
+            {"_id": key, "leaseOwner": owner}, {"$set": {"leaseExpiry": 0}})
+
+    def apply_indexes(self, collection_name, indexes: list):
+        """Create the missing [(name, keys, options)] indexes, TTL changes of existing ones are applied with collMod"""
+        col = self.mongo_db[collection_name]
+        existing = col.index_information()
+        for name, keys, options in indexes:
+            ttl = options.get("expireAfterSeconds")
+            current = existing.get(name)
+            if current is not None and ttl is not None and current.get("expireAfterSeconds") != ttl:
+                self.mongo_db.command({"collMod": collection_name, "index": {"name": name, "expireAfterSeconds": ttl}})
+                logger.info(f"Set TTL of {collection_name}.{name} to {ttl}s")
+            elif current is None:
+                col.create_index(keys, name=name, **options)
+                logger.info(f"Created index {collection_name}.{name}")
+
+    def is_indexed_query(self, collection_name, filter_: dict, sort: list = None) -> bool:
+        """Explain the query, False if its winning plan scans the whole collection"""
+        cursor = self.mongo_db[collection_name].find(filter_)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        return "COLLSCAN" not in get_plan_stages(plan)
+
     def delete_documents(self, collection, filter_):
         self.mongo_db[collection].delete_many(filter_)
 
@@ -187,4 +299,31 @@ class MongoDB:
         for field in projection:
             projection_statements[field] = True
 
-        return projection_statements
\ No newline at end of file
+        return projection_statements
+
+
+def get_plan_stages(plan: dict) -> set:
+    stages, stack = set(), [plan]
+    while stack:
+        node = stack.pop()
+        if "stage" in node:
+            stages.add(node["stage"])
+        # Classic plans nest inputStage(s), slot based plans wrap them in queryPlan
+        for key in ("inputStage", "queryPlan"):
+            if isinstance(node.get(key), dict):
+                stack.append(node[key])
+        stack.extend(node.get("inputStages", []))
+    return stages
+
+
+def get_path_prefixes(path):
+    parts = path.split('.')
+    return ['.'.join(parts[:i]) for i in range(1, len(parts))]
+
+
+def has_path_conflict(path, paths, prefixes, path_prefixes=None):
+    if path in paths or path in prefixes:
+        return True
+    if path_prefixes is None:
+        path_prefixes = get_path_prefixes(path)
+    return any(prefix in paths for prefix in path_prefixes)
@@ -0,0 +1,113 @@
+import gzip
+import io
+import json
+import os
+import pathlib
+import time
+import zlib
+from datetime import datetime, timezone
+
+from constants.twitter import RawPages
+from utils.logger_utils import get_logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = get_logger('Raw Archive')
+
+EXTENSIONS = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+
+class RawArchive:
+    """
+    Raw GraphQL pages appended to compressed JSONL segments:
+    <root_path>/<stream type>/<user id>/<YYYY-MM-DD>.jsonl.gz (or .zst)
+    Each line is {fetchedAt, userId, response}. Segments are appended to, one compressed frame per open.
+    """
+
+    def __init__(self, root_path, compression="gzip"):
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Unsupported compression {compression}, use one of {list(EXTENSIONS)}")
+        if compression == "zstd" and zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package")
+        self.root_path = root_path
+        self.compression = compression
+        self._files = {}
+
+    def get_path(self, stream_type, user_id, date):
+        return os.path.join(self.root_path, stream_type, str(user_id), f'{date}{EXTENSIONS[self.compression]}')
+
+    def write(self, stream_type, user_id, response: dict, fetched_at=None):
+        fetched_at = int(fetched_at or time.time())
+        date = datetime.fromtimestamp(fetched_at, timezone.utc).strftime('%Y-%m-%d')
+        file = self._get_file(stream_type, user_id, date)
+        line = json.dumps({
+            RawPages.fetched_at: fetched_at,
+            RawPages.user_id: str(user_id),
+            RawPages.response: response,
+        }, separators=(',', ':'))
+        file.write(line.encode() + b'\n')
+
+    def _get_file(self, stream_type, user_id, date):
+        key = (stream_type, str(user_id))
+        opened = self._files.get(key)
+        if opened is not None:
+            opened_date, file = opened
+            if opened_date == date:
+                return file
+            file.close()
+        path = self.get_path(stream_type, user_id, date)
+        pathlib.Path(os.path.dirname(path)).mkdir(parents=True, exist_ok=True)
+        if self.compression == "zstd":
+            file = zstandard.ZstdCompressor().stream_writer(open(path, 'ab'), closefd=True)
+        else:
+            file = gzip.open(path, 'ab')
+        self._files[key] = (date, file)
+        return file
+
+    def close(self):
+        """Close open segments so they can be replayed"""
+        for _, file in self._files.values():
+            file.close()
+        self._files = {}
+
+    def list_segments(self, stream_types=None, user_ids=None, start_date=None, end_date=None) -> list:
+        """[(stream type, user id, path)] of segments matching the filters, dates are YYYY-MM-DD and inclusive"""
+        segments = []
+        user_ids = {str(user_id) for user_id in user_ids} if user_ids else None
+        for stream_type in sorted(os.listdir(self.root_path)) if os.path.isdir(self.root_path) else []:
+            if stream_types and stream_type not in stream_types:
+                continue
+            for user_id in sorted(os.listdir(os.path.join(self.root_path, stream_type))):
+                if user_ids and user_id not in user_ids:
+                    continue
+                directory = os.path.join(self.root_path, stream_type, user_id)
+                for file_name in sorted(os.listdir(directory)):
+                    date, _, extension = file_name.partition('.')
+                    if '.' + extension not in EXTENSIONS.values():
+                        continue
+                    if (start_date and date < start_date) or (end_date and date > end_date):
+                        continue
+                    segments.append((stream_type, user_id, os.path.join(directory, file_name)))
+        return segments
+
+
+def read_segment(path):
+    """Yield the records of a segment, a truncated last frame (crash while writing) is skipped"""
+    if path.endswith(EXTENSIONS["zstd"]):
+        if zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package")
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+    else:
+        raw = gzip.open(path, 'rb')
+    with io.TextIOWrapper(raw, encoding='utf-8') as file:
+        try:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skip a truncated line of {path}")
+        except (EOFError, zlib.error, getattr(zstandard, 'ZstdError', EOFError)) as ex:
+            logger.warning(f"Stop reading {path} at a truncated frame: {ex}")
@@ -0,0 +1,92 @@
+import time
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+
+from constants.twitter import CrawlTasks
+
+
+class MongoTaskQueue:
+    """
+    Crawl tasks (project, stream type) shared by crawler nodes.
+    Tasks are claimed with an atomic find_one_and_update and leased for a while, a node that dies
+    lets its lease expire and another node picks the task up again. Crawl progress is not kept here,
+    a claimed task resumes from the CrawlState of its stream. Indexes are registered in MongoIndexes.
+    """
+
+    def __init__(self, collection):
+        """
+        Args:
+            * collection: pymongo (or mongomock) collection holding the tasks
+        """
+        self.collection = collection
+
+    @staticmethod
+    def get_task_id(project, stream_type):
+        return f'{stream_type}_{project}'
+
+    def enqueue(self, project, stream_type, priority=0, next_due_at=None):
+        """Add the task if missing, existing tasks keep their schedule"""
+        self.collection.update_one(
+            {CrawlTasks.id_: self.get_task_id(project, stream_type)},
+            {
+                "$set": {CrawlTasks.priority: priority},
+                "$setOnInsert": {
+                    CrawlTasks.project: project,
+                    CrawlTasks.stream_type: stream_type,
+                    CrawlTasks.next_due_at: next_due_at if next_due_at is not None else int(time.time()),
+                    CrawlTasks.lease_owner: None,
+                    CrawlTasks.lease_expiry: 0,
+                    CrawlTasks.attempts: 0,
+                }
+            },
+            upsert=True)
+
+    def claim(self, owner, lease_ttl, stream_types=None) -> dict:
+        """Lease the due task with the highest priority, None if no task is due"""
+        now = int(time.time())
+        filter_statement = {
+            CrawlTasks.next_due_at: {"$lte": now},
+            "$or": [{CrawlTasks.lease_owner: None}, {CrawlTasks.lease_expiry: {"$lt": now}}]
+        }
+        if stream_types is not None:
+            filter_statement[CrawlTasks.stream_type] = {"$in": list(stream_types)}
+        return self.collection.find_one_and_update(
+            filter_statement,
+            {
+                "$set": {CrawlTasks.lease_owner: owner, CrawlTasks.lease_expiry: now + lease_ttl},
+                "$inc": {CrawlTasks.attempts: 1}
+            },
+            sort=[(CrawlTasks.priority, DESCENDING), (CrawlTasks.next_due_at, ASCENDING)],
+            return_document=ReturnDocument.AFTER)
+
+    def renew(self, task_id, owner, lease_ttl) -> bool:
+        result = self.collection.update_one(
+            {CrawlTasks.id_: task_id, CrawlTasks.lease_owner: owner},
+            {"$set": {CrawlTasks.lease_expiry: int(time.time()) + lease_ttl}})
+        return result.matched_count > 0
+
+    def complete(self, task_id, owner, next_due_at=None):
+        """Release the task, it is due again at next_due_at (never if None)"""
+        self._release(task_id, owner, {
+            CrawlTasks.next_due_at: next_due_at,
+            CrawlTasks.attempts: 0,
+            CrawlTasks.last_error: None,
+        })
+
+    def fail(self, task_id, owner, error, retry_delay):
+        """Release the task to be retried after retry_delay seconds"""
+        self._release(task_id, owner, {
+            CrawlTasks.next_due_at: int(time.time()) + retry_delay,
+            CrawlTasks.last_error: str(error),
+        })
+
+    def _release(self, task_id, owner, values: dict):
+        self.collection.update_one(
+            {CrawlTasks.id_: task_id, CrawlTasks.lease_owner: owner},
+            {"$set": {CrawlTasks.lease_owner: None, CrawlTasks.lease_expiry: 0, **values}})
+
+    def count_due(self, stream_types=None) -> int:
+        filter_statement = {CrawlTasks.next_due_at: {"$lte": int(time.time())}}
+        if stream_types is not None:
+            filter_statement[CrawlTasks.stream_type] = {"$in": list(stream_types)}
+        return self.collection.count_documents(filter_statement)
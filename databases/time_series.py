@@ -0,0 +1,48 @@
+import time
+from datetime import datetime, timezone
+
+from constants.twitter import TimeSeries
+from databases.mongodb import MongoDB
+from utils.time_utils import round_timestamp
+
+
+class TimeSeriesBuckets:
+    """
+    Metrics of one entity grouped into a document per bucket_size seconds:
+    {_id: "<key>_<bucket>", key, bucket, logs: {<timestamp>: values}}
+    """
+
+    def __init__(self, collection_name, bucket_size):
+        self.collection_name = collection_name
+        self.bucket_size = bucket_size
+
+    def to_bucket_doc(self, key, timestamp, values: dict) -> dict:
+        timestamp = int(timestamp)
+        bucket = round_timestamp(timestamp, round_time=self.bucket_size)
+        # Expiry counts from the write, a replay of older logs must not move it back on a bucket with newer ones
+        now = int(time.time())
+        return {
+            TimeSeries.id_: f'{key}_{bucket}',
+            TimeSeries.key: str(key),
+            TimeSeries.bucket: bucket,
+            TimeSeries.logs: {str(timestamp): values},
+            TimeSeries.last_updated_at: now,
+            # BSON date read by the TTL index
+            TimeSeries.last_updated_date: datetime.fromtimestamp(now, timezone.utc),
+        }
+
+    def get_range(self, exporter: MongoDB, key, start_timestamp, end_timestamp) -> list:
+        """[(timestamp, values)] of key between start_timestamp and end_timestamp, oldest first"""
+        filter_ = {
+            TimeSeries.key: str(key),
+            TimeSeries.bucket: {
+                "$gte": round_timestamp(start_timestamp, round_time=self.bucket_size),
+                "$lte": end_timestamp
+            }
+        }
+        points = []
+        for doc in exporter.get_docs(self.collection_name, filter_=filter_):
+            for timestamp, values in doc.get(TimeSeries.logs, {}).items():
+                if start_timestamp <= int(timestamp) <= end_timestamp:
+                    points.append((int(timestamp), values))
+        return sorted(points, key=lambda point: point[0])
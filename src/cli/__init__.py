@@ -1,5 +1,6 @@
 import click
 
+from src.cli.raw_archive_replay import raw_archive_replay
 from src.cli.twitter_projects_crawler import twitter_projects_crawler
 
 
@@ -13,3 +14,4 @@ def cli(ctx):
 
 # Stream
 cli.add_command(twitter_projects_crawler, "twitter_projects_crawler")
+cli.add_command(raw_archive_replay, "raw_archive_replay")
@@ -0,0 +1,44 @@
+import click
+
+from constants.config import CrawlerConfig
+from constants.mongo_constant import MongoCollection
+from src.jobs.raw_replay_job import RawReplayJob
+from utils.logger_utils import get_logger
+
+logger = get_logger('Raw Archive Replay')
+
+
+@click.command(context_settings=dict(help_option_names=['-h', '--help']))
+@click.option('-a', '--archive-path', default=CrawlerConfig.DATA_PATH + 'raw_archive', show_default=True, type=str,
+              help='Root directory of the raw archive')
+@click.option('-o', '--output-url', default=None, type=str, help='mongo output url')
+@click.option('-col', '--collection', default=MongoCollection.tweets, type=str, help='mongo tweets collection')
+@click.option('-st', '--stream-types', default=[], type=str, multiple=True,
+              help='Archived streams to replay: followers, user_tweets. All by default')
+@click.option('-u', '--user-ids', default=[], type=str, multiple=True, help='Only replay these project user ids')
+@click.option('-s', '--start-date', default=None, type=str, help='First replayed day, YYYY-MM-DD')
+@click.option('-e', '--end-date', default=None, type=str, help='Last replayed day, YYYY-MM-DD')
+@click.option('-w', '--workers', default=None, type=int, help='Number of worker processes, one per core by default')
+@click.option('-wb', '--write-batch-size', default=1000, show_default=True, type=int,
+              help='Number of documents per mongo write')
+@click.option('--follow-storage', default='edges', show_default=True, type=click.Choice(['edges', 'buckets', 'both']),
+              help='Replay follows as one document per edge, into packed follower id buckets, or both')
+@click.option('--follow-bucket-size', default=50000, show_default=True, type=int,
+              help='Max follower ids per bucket document')
+def raw_archive_replay(archive_path, output_url, collection, stream_types, user_ids, start_date, end_date, workers,
+                       write_batch_size, follow_storage, follow_bucket_size):
+    job = RawReplayJob(
+        archive_path=archive_path,
+        connection_url=output_url,
+        database="cdp_database",
+        collection=collection,
+        stream_types=stream_types,
+        user_ids=user_ids,
+        start_date=start_date,
+        end_date=end_date,
+        n_workers=workers,
+        batch_size=write_batch_size,
+        follow_storage=follow_storage,
+        follow_bucket_size=follow_bucket_size,
+    )
+    job.run()
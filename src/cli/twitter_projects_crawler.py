@@ -1,15 +1,33 @@
 import click
 
-from constants.config import AccountConfig
+from constants.config import AccountConfig, CrawlerConfig
 from constants.time_constant import TimeConstants
 from constants.mongo_constant import MongoCollection
 from databases.mongodb import MongoDB
+from src.crawler.account_pool import load_accounts_from_file, load_accounts_from_mongo
 from src.jobs.twitter_projects_crawling_job import TwitterProjectCrawlingJob
 from utils.logger_utils import get_logger
+from utils.rate_limit_utils import parse_budgets
 
 logger = get_logger('Twitter Projects Crawler')
 
 
+def parse_stream_intervals(ctx, param, values):
+    # ('tweets=3600', ...) -> {'tweets': 3600}
+    try:
+        return {stream_type: int(interval) for stream_type, interval in (value.split('=', 1) for value in values)}
+    except ValueError:
+        raise click.BadParameter('format must be stream_type=seconds')
+
+
+def parse_rate_limits(ctx, param, values):
+    # ('followers=50:1000', ...) -> {'followers': (50.0, 1000.0)}
+    try:
+        return parse_budgets(values)
+    except ValueError:
+        raise click.BadParameter('format must be endpoint=rate[:burst]')
+
+
 @click.command(context_settings=dict(help_option_names=['-h', '--help']))
 @click.option('-i', '--interval', default=TimeConstants.A_DAY, type=int, help='Sleep time')
 @click.option('-pe', '--period', default=TimeConstants.DAYS_2, type=int, help='Sleep time')
@@ -30,9 +48,81 @@ logger = get_logger('Twitter Projects Crawler')
               type=str, help='email password')
 @click.option('-st', '--stream-types', default=["projects", "tweets", "followers"], show_default=True,
               type=str, multiple=True, help='Stream types: projects, tweets, followers')
+@click.option('-wb', '--write-batch-size', default=1000, show_default=True, type=int,
+              help='Number of buffered documents per collection that triggers a mongo write')
+@click.option('-fi', '--flush-interval', default=5, show_default=True, type=int,
+              help='Max seconds a document stays buffered before being written')
+@click.option('-rl', '--rate-limit', default=[], type=str, multiple=True, callback=parse_rate_limits,
+              help='Endpoint budget as endpoint=rate[:burst], e.g. followers=50:1000')
+@click.option('-c', '--concurrency', default=1, show_default=True, type=int,
+              help='Number of project streams crawled at the same time')
+@click.option('-af', '--accounts-file', default=None, type=str,
+              help='JSON file with a list of twitter accounts (username, password, email, emailPassword)')
+@click.option('--accounts-from-db', is_flag=True, default=False,
+              help='Load twitter accounts from the configs collection')
+@click.option('-cp', '--checkpoint-pages', default=10, show_default=True, type=int,
+              help='Number of crawled pages between two saved resume cursors')
+@click.option('--follower-diff', is_flag=True, default=False,
+              help='Only write new follows and record unfollows, based on the follower ids of the last run')
+@click.option('--follower-sets-path', default=CrawlerConfig.DATA_PATH + 'follower_sets', show_default=True,
+              type=str, help='Directory of the per-project follower id files')
+@click.option('--profile-refresh-days', default=1, show_default=True, type=int,
+              help='With --follower-diff, profiles of known followers are refreshed once every N days')
+@click.option('--skip-unchanged', is_flag=True, default=False,
+              help='Skip writing users and tweets whose content fingerprint did not change')
+@click.option('--fingerprint-cache-path', default=None, type=str,
+              help='dbm file keeping fingerprints across restarts, in memory only if not set')
+@click.option('--fingerprint-cache-size', default=1000000, show_default=True, type=int,
+              help='Number of fingerprints kept in memory')
+@click.option('--handle-cache-ttl', default=TimeConstants.DAYS_7, show_default=True, type=int,
+              help='Seconds a persisted handle to user id mapping is trusted')
+@click.option('--accounts-db', default=None, type=str,
+              help='twscrape accounts db, keeps account sessions across runs. '
+                   'accounts.db by default, accounts_<shard index>.db when sharded')
+@click.option('-si', '--stream-intervals', default=[], type=str, multiple=True, callback=parse_stream_intervals,
+              help='Interval of a stream type as stream_type=seconds, e.g. tweets=3600. Others use --interval')
+@click.option('-j', '--jitter', default=0, show_default=True, type=int,
+              help='Max random seconds added to each scheduled run')
+@click.option('--shard-index', default=0, show_default=True, type=int, help='Index of this crawler process')
+@click.option('--shard-count', default=1, show_default=True, type=int,
+              help='Number of crawler processes sharing the projects and accounts')
+@click.option('--lease-ttl', default=TimeConstants.A_HOUR, show_default=True, type=int,
+              help='Seconds a project stream lease is held without renewal when sharded')
+@click.option('--use-queue', is_flag=True, default=False,
+              help='Share crawl tasks with other crawler nodes through the crawl_tasks collection')
+@click.option('--metrics-port', default=None, type=int, help='Serve prometheus metrics on this port')
+@click.option('--metrics-file', default=None, type=str, help='Write prometheus metrics to this textfile after each run')
+@click.option('--raw-archive-path', default=None, type=str,
+              help='Archive raw followers and tweets pages under this directory for replay')
+@click.option('--raw-archive-compression', default='gzip', show_default=True, type=click.Choice(['gzip', 'zstd']),
+              help='Compression of the raw archive segments')
+@click.option('--skip-index-setup', is_flag=True, default=False,
+              help='Do not create the crawler indexes at startup')
+@click.option('--logs-retention-days', default=None, type=int,
+              help='Expire count and impression log buckets this many days after their last update (TTL index)')
+@click.option('--follow-storage', default='edges', show_default=True, type=click.Choice(['edges', 'buckets', 'both']),
+              help='Store follows as one document per edge, as packed follower id buckets per project, or both')
+@click.option('--follow-bucket-size', default=50000, show_default=True, type=int,
+              help='Max follower ids per bucket document')
 def twitter_projects_crawler(interval, period, limit, collection, output_url, projects, projects_file, twitter_user,
-                             twitter_password, email, email_password, stream_types, twitter_key):
+                             twitter_password, email, email_password, stream_types, twitter_key, write_batch_size,
+                             flush_interval, rate_limit, concurrency, accounts_file, accounts_from_db,
+                             checkpoint_pages, follower_diff, follower_sets_path, profile_refresh_days,
+                             skip_unchanged, fingerprint_cache_path, fingerprint_cache_size, handle_cache_ttl,
+                             accounts_db, stream_intervals, jitter, shard_index, shard_count, lease_ttl,
+                             use_queue, metrics_port, metrics_file, raw_archive_path, raw_archive_compression,
+                             skip_index_setup, logs_retention_days, follow_storage, follow_bucket_size):
+    if not 0 <= shard_index < shard_count:
+        raise click.BadParameter('--shard-index must be in [0, --shard-count)')
+    if accounts_db is None:
+        # twscrape rotates over every account of its db, shards sharing one would ignore the account split
+        accounts_db = f"accounts_{shard_index}.db" if shard_count > 1 else "accounts.db"
     _exporter = MongoDB(connection_url=output_url, database="cdp_database")
+    accounts = []
+    if accounts_file:
+        accounts += load_accounts_from_file(accounts_file)
+    if accounts_from_db:
+        accounts += load_accounts_from_mongo(_exporter)
     job = TwitterProjectCrawlingJob(
         interval=interval,
         period=period,
@@ -47,5 +137,33 @@ def twitter_projects_crawler(interval, period, limit, collection, output_url, pr
         email_password=email_password,
         stream_types=stream_types,
         collection=collection,
+        write_batch_size=write_batch_size,
+        flush_interval=flush_interval,
+        rate_limits=rate_limit,
+        concurrency=concurrency,
+        accounts=accounts,
+        checkpoint_pages=checkpoint_pages,
+        follower_diff=follower_diff,
+        follower_sets_path=follower_sets_path,
+        profile_refresh_days=profile_refresh_days,
+        skip_unchanged=skip_unchanged,
+        fingerprint_cache_path=fingerprint_cache_path,
+        fingerprint_cache_size=fingerprint_cache_size,
+        handle_cache_ttl=handle_cache_ttl,
+        accounts_db=accounts_db,
+        stream_intervals=stream_intervals,
+        jitter=jitter,
+        shard_index=shard_index,
+        shard_count=shard_count,
+        lease_ttl=lease_ttl,
+        use_queue=use_queue,
+        metrics_port=metrics_port,
+        metrics_file=metrics_file,
+        raw_archive_path=raw_archive_path,
+        raw_archive_compression=raw_archive_compression,
+        setup_indexes=not skip_index_setup,
+        logs_retention=logs_retention_days * TimeConstants.A_DAY if logs_retention_days else None,
+        follow_storage=follow_storage,
+        follow_bucket_size=follow_bucket_size,
     )
     job.run()
@@ -0,0 +1,96 @@
+import json
+from datetime import datetime, timezone
+
+from twscrape import API
+
+from constants.mongo_constant import MongoCollection
+from constants.twitter import TwitterAccount
+from databases.mongodb import MongoDB
+from utils.logger_utils import get_logger
+from utils.metrics_utils import ACCOUNT_ACTIVE, ACCOUNT_REQUESTS
+
+logger = get_logger('Account Pool')
+
+# Cookies of a logged in twitter session
+SESSION_COOKIES = ["auth_token", "ct0"]
+
+
+def load_accounts_from_file(accounts_file: str) -> list:
+    with open(accounts_file, 'r') as file:
+        accounts = json.load(file)
+    return accounts
+
+
+def load_accounts_from_mongo(exporter: MongoDB) -> list:
+    doc = exporter.get_doc(MongoCollection.configs, key=TwitterAccount.config_key)
+    return doc.get(TwitterAccount.accounts, []) if doc else []
+
+
+def has_session_cookies(account) -> bool:
+    return all(account.cookies.get(cookie) for cookie in SESSION_COOKIES)
+
+
+class AccountManager:
+    """Loads many accounts into the twscrape pool and reports how they are used"""
+
+    def __init__(self, api: API):
+        self.api = api
+
+    async def add_accounts(self, accounts: list):
+        """Add accounts missing from the pool db, sessions of the known ones are reused"""
+        known = {account.username for account in await self.api.pool.get_all()}
+        for account in accounts:
+            if account[TwitterAccount.username] in known:
+                continue
+            await self.api.pool.add_account(
+                account[TwitterAccount.username],
+                account[TwitterAccount.password],
+                account.get(TwitterAccount.email),
+                account.get(TwitterAccount.email_password)
+            )
+        await self.refresh_sessions()
+
+    async def refresh_sessions(self):
+        """Only login accounts without a usable session"""
+        expired = [
+            account.username for account in await self.api.pool.get_all()
+            if account.active and not has_session_cookies(account)
+        ]
+        if expired:
+            logger.info(f"Session expired for {expired}, login again")
+            await self.api.pool.relogin(expired)
+        # Logs in accounts that are inactive without error, e.g. just added
+        await self.api.pool.login_all()
+        if not await self.count_active_accounts():
+            logger.warning("No active account, retry accounts that failed to login")
+            await self.api.pool.relogin_failed()
+
+    async def get_usable_accounts(self) -> list:
+        """Active accounts that are not parked on any queue right now"""
+        now = datetime.now(timezone.utc)
+        accounts = await self.api.pool.get_all()
+        return [
+            account for account in accounts
+            if account.active and not any(unlock_at > now for unlock_at in account.locks.values())
+        ]
+
+    async def count_active_accounts(self) -> int:
+        accounts = await self.api.pool.get_all()
+        return len([account for account in accounts if account.active])
+
+    async def log_stats(self):
+        now = datetime.now(timezone.utc)
+        for account in await self.api.pool.get_all():
+            ACCOUNT_ACTIVE.labels(account.username).set(int(account.active))
+            for queue, n_requests in account.stats.items():
+                ACCOUNT_REQUESTS.labels(account.username, queue).set(n_requests)
+            requests = sum(account.stats.values())
+            locks = {queue: unlock_at for queue, unlock_at in account.locks.items() if unlock_at > now}
+            if not account.active:
+                # Banned or failed to login, twscrape keeps it out of rotation
+                logger.warning(f"[{account.username}] parked (inactive): {account.error_msg}")
+            elif locks:
+                parked = ', '.join(f"{queue} until {unlock_at.isoformat()}" for queue, unlock_at in locks.items())
+                logger.info(f"[{account.username}] {requests} requests, rate limited on {parked}")
+            else:
+                logger.info(f"[{account.username}] {requests} requests {account.stats}")
@@ -0,0 +1,91 @@
+import asyncio
+
+import httpx
+from bs4 import BeautifulSoup as soup
+
+from utils.http_utils import DEFAULT_HEADERS, RETRY_STATUSES, get_backoff, get_host
+from utils.logger_utils import get_logger
+from utils.rate_limit_utils import RateLimiter
+
+logger = get_logger('Async Crawler')
+
+
+class AsyncCrawler:
+    """
+    Concurrent counterpart of Crawler on a keep-alive httpx client.
+    Requests are paced per host by a token bucket and retried with exponential backoff and jitter.
+    """
+
+    def __init__(self, rate=5, burst=None, concurrency=10, max_retry_times=3, timeout=30, backoff_base=1,
+                 headers: dict = None):
+        """
+        Args:
+            * rate: requests per second allowed on each host, burst: how many of them can be sent at once
+            * concurrency: max requests in flight, also the size of the connection pool
+        """
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.max_retry_times = max_retry_times
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.headers = {**DEFAULT_HEADERS, **(headers or {})}
+        self.rate_limiter = RateLimiter()
+        self._semaphore = None
+        self._client = None
+
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._client = httpx.AsyncClient(
+            headers=self.headers, timeout=self.timeout, follow_redirects=True,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency))
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._client.aclose()
+        self._client = None
+
+    async def _throttle(self, url):
+        host = get_host(url)
+        if host not in self.rate_limiter.buckets:
+            self.rate_limiter.set_budget(host, self.rate, self.burst)
+        await self.rate_limiter.acquire(host)
+
+    async def _retry_request(self, url, parse, func, headers=None, *args, **kwargs):
+        for retry_time in range(self.max_retry_times):
+            if retry_time:
+                await asyncio.sleep(get_backoff(retry_time - 1, base=self.backoff_base))
+            try:
+                await self._throttle(url)
+                async with self._semaphore:
+                    response = await self._client.get(url, headers=headers)
+                status = response.status_code
+                if 200 <= status < 300:
+                    return func(parse(response), *args, **kwargs)
+                logger.warning(f'Fail ({status}) to request url {url}')
+                if status not in RETRY_STATUSES:
+                    break
+            except Exception as ex:
+                logger.exception(ex)
+        return None
+
+    async def request(self, url, func, headers=None, *args, **kwargs):
+        return await self._retry_request(url, lambda response: response.json(), func, headers, *args, **kwargs)
+
+    async def fetch_data(self, url, func, *args, **kwargs):
+        return await self._retry_request(
+            url, lambda response: soup(response.text, "html.parser"), func, None, *args, **kwargs)
+
+    async def fetch_all(self, urls, func, *args, **kwargs) -> list:
+        """fetch_data of every url, concurrently. Results keep the order of urls"""
+        return await asyncio.gather(*[self.fetch_data(url, func, *args, **kwargs) for url in urls])
+
+    async def crawl_img(self, url):
+        try:
+            await self._throttle(url)
+            async with self._semaphore:
+                response = await self._client.get(url)
+            return response.content
+        except Exception as e:
+            logger.warning(e)
+            return ""
@@ -1,12 +1,15 @@
+import threading
 import time
 
-import requests
 from bs4 import BeautifulSoup as soup
 from selenium import webdriver
 
 from selenium.webdriver.chrome.options import Options
 
+from src.crawler.driver_pool import ChromeDriverPool
+from utils.http_utils import RETRY_STATUSES, get_backoff, get_host, get_session
 from utils.logger_utils import get_logger
+from utils.rate_limit_utils import TokenBucket
 
 logger = get_logger('Base Crawler')
 
@@ -17,67 +20,67 @@ class Crawler:
         if time_throttle > (end_time - start_time):
             time.sleep(time_throttle - end_time + start_time)
 
-    def __init__(self, soup_calls_limit=5, sleep_time=1, max_retry_times=3):
-        # Number of consecutive calls
-        self.get_url_soup_calls = 1
-        # Number of consecutive calls before sleep
+    def __init__(self, soup_calls_limit=5, sleep_time=1, max_retry_times=3, timeout=30, backoff_base=1):
+        # Number of calls allowed per sleep_time seconds on each host
         self.soup_calls_limit = soup_calls_limit
         # Sleep time
         self.sleep_time = sleep_time
         # Max number of retry times
         self.max_retry_times = max_retry_times
+        self.timeout = timeout
+        # Retries wait a random time up to backoff_base * 2^attempt seconds
+        self.backoff_base = backoff_base
+        self._buckets = {}
+        # TokenBucket is lock-free for a single event loop, crawlers are also shared by threads
+        self._buckets_lock = threading.Lock()
 
-    def _request(self, url, func, headers=None, *args, **kwargs):
-        retry_time = 0
-        data = None
-        while retry_time < self.max_retry_times:
+    def _throttle(self, url):
+        # Token bucket per host, spreads soup_calls_limit calls over sleep_time seconds instead of sleeping in bursts
+        host = get_host(url)
+        with self._buckets_lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(
+                    self.soup_calls_limit / self.sleep_time, self.soup_calls_limit)
+            wait = bucket.reserve()
+        # Sleep outside the lock, the reservation already keeps the place of this call
+        if wait > 0:
+            time.sleep(wait)
+
+    def _retry_request(self, url, parse, func, headers=None, throttle=True, *args, **kwargs):
+        for retry_time in range(self.max_retry_times):
+            if retry_time:
+                time.sleep(get_backoff(retry_time - 1, base=self.backoff_base))
             try:
-                response = requests.get(url, headers=headers)
+                if throttle:
+                    self._throttle(url)
+                response = get_session(url).get(url, headers=headers, timeout=self.timeout)
                 status = response.status_code
                 if 200 <= status < 300:
-                    resp = response.json()
-                    data = func(resp, *args, **kwargs)
+                    return func(parse(response), *args, **kwargs)
+                logger.warning(f'Fail ({status}) to request url {url}')
+                if status not in RETRY_STATUSES:
                     break
-                else:
-                    logger.warning(f'Fail ({status}) to request url {url}')
             except Exception as ex:
                 logger.exception(ex)
-            retry_time += 1
-        return data
+        return None
+
+    def _request(self, url, func, headers=None, *args, **kwargs):
+        # JSON APIs are not paced by soup_calls_limit
+        return self._retry_request(url, lambda response: response.json(), func, headers, False, *args, **kwargs)
 
     def _get_url_soup(self, url):
         # Read the html of the page
-        if self.get_url_soup_calls <= self.soup_calls_limit:
-            self.get_url_soup_calls += 1
-        else:
-            time.sleep(self.sleep_time)
-            # Reset get_url_soup_calls
-            self.get_url_soup_calls = 1
-
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/71.0.3578.98 Safari/537.36",
-        }
-        response = requests.get(url, headers=headers)
+        self._throttle(url)
+        response = get_session(url).get(url, timeout=self.timeout)
         status = response.status_code
         content = response.text
         page_soup = soup(content, "html.parser")
         return page_soup, status
 
     def fetch_data(self, url, func, *args, **kwargs):
-        retry_time = 0
-        data = None
-        while retry_time < self.max_retry_times:
-            try:
-                page_soup, status = self._get_url_soup(url)
-                if 200 <= status < 300:
-                    data = func(page_soup, *args, **kwargs)
-                    break
-                else:
-                    logger.warning(f'Fail ({status}) to request url {url}')
-            except Exception as ex:
-                logger.exception(ex)
-            retry_time += 1
-        return data
+        return self._retry_request(
+            url, lambda response: soup(response.text, "html.parser"), func, None, True, *args, **kwargs)
 
     @staticmethod
     def use_chrome_driver(driver, url, handler_func, **kwargs):
@@ -87,11 +90,13 @@ class Crawler:
             data = handler_func(driver, **kwargs)
         except Exception as ex:
             logger.exception(ex)
-        finally:
-            # driver.quit()
-            ...
+        # The caller owns the driver, use get_driver_pool to reuse and recycle drivers
         return data
 
+    @classmethod
+    def get_driver_pool(cls, size=2, max_pages=100, max_memory_mb=1024) -> ChromeDriverPool:
+        return ChromeDriverPool(cls.get_driver, size=size, max_pages=max_pages, max_memory_mb=max_memory_mb)
+
     @classmethod
     def get_driver(cls):
         chrome_options = Options()
@@ -113,13 +118,16 @@ class Crawler:
         driver = webdriver.Chrome(options=chrome_options)
         return driver
 
+    def fetch_img(self, url):
+        """Image bytes, paced and retried like fetch_data. "" on failure like crawl_img"""
+        content = self._retry_request(url, lambda response: response.content, lambda data: data, None, True)
+        return content if content is not None else ""
+
     @staticmethod
-    def crawl_img(url):
+    def crawl_img(url, timeout=30):
+        # Unpaced and not retried, kept for Crawler.crawl_img(url) callers. Use fetch_img on an instance
         try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/71.0.3578.98 Safari/537.36",
-            }
-            response = requests.get(url, headers=headers)
+            response = get_session(url).get(url, timeout=timeout)
             return response.content
         except Exception as e:
             logger.warning(e)
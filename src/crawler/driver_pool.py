@@ -0,0 +1,192 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from utils.logger_utils import get_logger
+
+logger = get_logger('Chrome Driver Pool')
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def get_process_tree_rss(pid):
+    """Resident memory in MB of pid and its descendants, None where /proc is not available"""
+    if not os.path.isdir(f'/proc/{pid}'):
+        return None
+    rss, stack = 0, [pid]
+    while stack:
+        pid = stack.pop()
+        try:
+            with open(f'/proc/{pid}/statm') as file:
+                rss += int(file.read().split()[1]) * PAGE_SIZE
+            # Children are listed per thread, chrome starts its GPU and utility processes from other threads
+            tids = os.listdir(f'/proc/{pid}/task')
+        except (OSError, ValueError):
+            continue
+        for tid in tids:
+            try:
+                with open(f'/proc/{pid}/task/{tid}/children') as file:
+                    stack.extend(int(child) for child in file.read().split())
+            except (OSError, ValueError):
+                continue
+    return rss / 2 ** 20
+
+
+class ChromeDriverPool:
+    """
+    Bounded pool of reusable webdrivers.
+    Drivers are checked before each checkout and recycled after max_pages pages or above max_memory_mb.
+    """
+
+    def __init__(self, create_driver, size=2, max_pages=100, max_memory_mb=1024, checkout_timeout=None):
+        """
+        Args:
+            * create_driver: function returning a new driver, e.g. Crawler.get_driver
+            * size: max number of drivers alive at the same time
+            * max_pages: pages handled by a driver before it is replaced
+            * max_memory_mb: a driver whose browser processes use more memory is replaced
+            * checkout_timeout: max seconds to wait for a free driver, forever if None
+        """
+        self.create_driver = create_driver
+        self.size = size
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+        self.checkout_timeout = checkout_timeout
+
+        self._available = queue.LifoQueue()
+        self._pages = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"created": 0, "recycled": 0, "unhealthy": 0, "pages": 0}
+
+    def checkout(self):
+        """Take a healthy driver, a new one is started while the pool is not full"""
+        while True:
+            if self._closed:
+                raise RuntimeError('Driver pool is closed')
+            driver = self._get_driver()
+            if self.is_healthy(driver):
+                return driver
+            with self._lock:
+                self.stats["unhealthy"] += 1
+            self._quit(driver)
+
+    def _get_driver(self):
+        begin = time.time()
+        while True:
+            try:
+                return self._available.get_nowait()
+            except queue.Empty:
+                pass
+            driver = self._create()
+            if driver is not None:
+                return driver
+            if self.checkout_timeout is not None and time.time() - begin > self.checkout_timeout:
+                raise TimeoutError(f'No driver available after {self.checkout_timeout}s')
+            # Slots are also freed by recycled drivers, which are not put back
+            try:
+                return self._available.get(timeout=1)
+            except queue.Empty:
+                continue
+
+    def checkin(self, driver, broken=False):
+        """Give the driver back, it is quit instead when broken, closed, or due for recycling"""
+        with self._lock:
+            self._pages[driver] = self._pages.get(driver, 0) + 1
+            self.stats["pages"] += 1
+            n_pages = self._pages[driver]
+        if broken or self._closed or n_pages >= self.max_pages or self._is_over_memory(driver):
+            if not broken:
+                with self._lock:
+                    self.stats["recycled"] += 1
+            self._quit(driver)
+            return
+        self._available.put(driver)
+
+    @contextmanager
+    def driver(self):
+        driver = self.checkout()
+        try:
+            yield driver
+        except Exception:
+            self.checkin(driver, broken=not self.is_healthy(driver))
+            raise
+        self.checkin(driver)
+
+    def run(self, url, handler_func, **kwargs):
+        """Open url on a pooled driver and return handler_func(driver, **kwargs), None on error"""
+        try:
+            with self.driver() as driver:
+                driver.get(url)
+                return handler_func(driver, **kwargs)
+        except Exception as ex:
+            logger.exception(ex)
+            return None
+
+    def map(self, urls, handler_func, **kwargs) -> list:
+        """run() every url, one thread per pooled driver. Results keep the order of urls"""
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            return list(executor.map(lambda url: self.run(url, handler_func, **kwargs), urls))
+
+    @staticmethod
+    def is_healthy(driver) -> bool:
+        try:
+            driver.execute_script('return 1')
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        """Quit idle drivers, checked out ones are quit when they are checked in"""
+        self._closed = True
+        while True:
+            try:
+                self._quit(self._available.get_nowait())
+            except queue.Empty:
+                break
+        logger.info(f"Driver pool closed: {self.stats}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _create(self):
+        with self._lock:
+            if len(self._pages) >= self.size:
+                return None
+            # Reserve the slot before the slow browser start
+            placeholder = object()
+            self._pages[placeholder] = 0
+        try:
+            driver = self.create_driver()
+        except Exception:
+            with self._lock:
+                self._pages.pop(placeholder)
+            raise
+        with self._lock:
+            self._pages.pop(placeholder)
+            self._pages[driver] = 0
+            self.stats["created"] += 1
+        return driver
+
+    def _quit(self, driver):
+        with self._lock:
+            self._pages.pop(driver, None)
+        try:
+            driver.quit()
+        except Exception as ex:
+            logger.warning(f"Failed to quit driver: {ex}")
+
+    def _is_over_memory(self, driver) -> bool:
+        if not self.max_memory_mb:
+            return False
+        try:
+            rss = get_process_tree_rss(driver.service.process.pid)
+        except AttributeError:
+            return False
+        return rss is not None and rss > self.max_memory_mb
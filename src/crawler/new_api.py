@@ -1,16 +1,24 @@
-import asyncio
-import time
 from typing import AsyncGenerator, TypeVar
 
-from twscrape import API, parse_users
+from twscrape import API, parse_tweets, parse_users
 from twscrape.api import OP_Followers
 
+from constants.twitter import Endpoints, RateLimits
 from utils.logger_utils import get_logger
+from utils.metrics_utils import API_REQUESTS, ITEMS
+from databases.raw_archive import RawArchive
+from utils.rate_limit_utils import RateLimiter
 
 T = TypeVar("T")
 logger = get_logger("New API Twitter GraphQl")
 
 class NewAPi(API):
+    def __init__(self, *args, rate_limiter: RateLimiter = None, archive: RawArchive = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = rate_limiter or RateLimiter(RateLimits.budgets)
+        # Raw pages are kept for replay when an archive is set
+        self.archive = archive
+
     async def followers_raw(self, uid: int, limit=-1, kv=None):
         op = OP_Followers
         kv = {"userId": str(uid), "count": 20, "includePromotedContent": False, **(kv or {})}
@@ -18,17 +26,47 @@ class NewAPi(API):
         async for x in self._gql_items(op, kv, limit=limit, ft=ft):
             yield x
 
-    async def followers(self, uid: int, limit=-1, kv=None):
+    async def followers_pages(self, uid: int, limit=-1, kv=None):
+        """Yield (users, cursor of the next page) for each followers page, resume with kv={"cursor": cursor}"""
         async for rep in self.followers_raw(uid, limit=limit, kv=kv):
-            for x in parse_users(rep.json(), limit):
+            obj = rep.json()
+            if self.archive is not None:
+                self.archive.write(Endpoints.followers, uid, obj)
+            users = list(parse_users(obj, limit))
+            API_REQUESTS.labels(Endpoints.followers).inc()
+            ITEMS.labels(Endpoints.followers).inc(len(users))
+            if users:
+                await self.rate_limiter.acquire(Endpoints.followers, len(users))
+            yield users, self._get_cursor(obj)
+
+    async def followers(self, uid: int, limit=-1, kv=None):
+        async for users, _ in self.followers_pages(uid, limit=limit, kv=kv):
+            for x in users:
                 yield x
 
-    async def gather(self, gen: AsyncGenerator[T, None], time_sleep: int = 1, n_items: int = 1000) -> list[T]:
-        items = []
-        async for x in gen:
-            items.append(x)
-            total_n_items = len(items)
-            if total_n_items and not (total_n_items % n_items):
+    async def user_tweets(self, uid: int, limit=-1, kv=None):
+        async for tweets, _ in self.user_tweets_pages(uid, limit=limit, kv=kv):
+            for x in tweets:
+                yield x
+
+    async def user_tweets_pages(self, uid: int, limit=-1, kv=None):
+        """Yield (tweets, cursor of the next page) for each timeline page, resume with kv={"cursor": cursor}"""
+        async for rep in self.user_tweets_raw(uid, limit=limit, kv=kv):
+            obj = rep.json()
+            if self.archive is not None:
+                self.archive.write(Endpoints.user_tweets, uid, obj)
+            tweets = list(parse_tweets(obj, limit))
+            API_REQUESTS.labels(Endpoints.user_tweets).inc()
+            ITEMS.labels(Endpoints.user_tweets).inc(len(tweets))
+            if tweets:
+                await self.rate_limiter.acquire(Endpoints.user_tweets, len(tweets))
+            yield tweets, self._get_cursor(obj)
+
+    async def user_by_login(self, login: str, kv=None):
+        await self.rate_limiter.acquire(Endpoints.user_by_login)
+        API_REQUESTS.labels(Endpoints.user_by_login).inc()
+        return await super().user_by_login(login, kv=kv)
 
-                time.sleep(time_sleep)
-        return items
+    async def gather(self, gen: AsyncGenerator[T, None]) -> list[T]:
+        # Pacing is done by the rate limiter of each endpoint
+        return [x async for x in gen]
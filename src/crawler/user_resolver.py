@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+from twscrape import User
+
+from constants.mongo_constant import MongoCollection
+from constants.twitter import TwitterHandles
+from databases.mongodb import MongoDB
+from src.crawler.new_api import NewAPi
+from utils.logger_utils import get_logger
+
+logger = get_logger('User Resolver')
+
+
+class UserResolver:
+    """
+    Resolves twitter handles with at most one user_by_login call per handle and run.
+    Handle -> user id mappings are also kept in the configs collection for ttl seconds.
+    """
+
+    def __init__(self, api: NewAPi, exporter: MongoDB, ttl: int, collection_name=MongoCollection.configs):
+        self.api = api
+        self.exporter = exporter
+        self.ttl = ttl
+        self.collection_name = collection_name
+        self._lookups = {}
+        self.stats = {"api_calls": 0, "cache_hits": 0}
+
+    @staticmethod
+    def get_key(handle):
+        return f"twitter_handle_{handle.lower()}"
+
+    async def get_user(self, handle) -> User:
+        """Profile of handle, shared by every stream of the run"""
+        key = handle.lower()
+        if key not in self._lookups:
+            self._lookups[key] = asyncio.ensure_future(self._lookup(handle))
+        try:
+            return await self._lookups[key]
+        except (Exception, asyncio.CancelledError):
+            # Let the next caller retry a failed or cancelled lookup
+            self._lookups.pop(key, None)
+            raise
+
+    async def get_user_id(self, handle) -> int:
+        """User id of handle, from this run, then the persisted mapping, then the API"""
+        lookup = self._lookups.get(handle.lower())
+        if lookup is None:
+            doc = await asyncio.to_thread(self.exporter.get_doc, self.collection_name, key=self.get_key(handle))
+            if doc and doc.get(TwitterHandles.last_updated_at, 0) + self.ttl > time.time():
+                self.stats["cache_hits"] += 1
+                return int(doc[TwitterHandles.user_id])
+        user = await self.get_user(handle)
+        return user.id if user is not None else None
+
+    async def _lookup(self, handle) -> User:
+        self.stats["api_calls"] += 1
+        user = await self.api.user_by_login(handle)
+        if user is not None:
+            await asyncio.to_thread(self.exporter.update_docs, self.collection_name, [{
+                TwitterHandles.id_: self.get_key(handle),
+                TwitterHandles.handle: handle,
+                TwitterHandles.user_id: str(user.id),
+                TwitterHandles.last_updated_at: int(time.time()),
+            }], flatten=False)
+        return user
+
+    def log_stats(self):
+        logger.info(f"Resolved handles with {self.stats['api_calls']} api calls "
+                    f"and {self.stats['cache_hits']} cached ids")
@@ -0,0 +1,142 @@
+import multiprocessing
+import os
+import time
+
+from twscrape import parse_tweets, parse_users
+
+from constants.mongo_constant import MongoCollection
+from constants.twitter import Endpoints, RawPages
+from databases.follow_buckets import FollowBucketStore
+from databases.mongodb import MongoDB
+from databases.raw_archive import RawArchive, read_segment
+from src.jobs.twitter_projects_crawling_job import TwitterProjectCrawlingJob
+from utils.logger_utils import get_logger
+
+logger = get_logger('Raw Replay Job')
+
+# MongoDB of the current worker process, pymongo clients must not be shared across forks
+_exporter = None
+
+
+def _init_worker(connection_url, database):
+    global _exporter
+    _exporter = MongoDB(connection_url=connection_url, database=database)
+
+
+def replay_segments(stream_type, user_id, paths, collection, batch_size, follow_storage="edges",
+                    follow_bucket_size=50000):
+    """
+    Parse and convert the pages of the segments of one stream into mongo.
+    Returns the number of written docs and the number of docs of the batches that failed to be written
+    """
+    buffers = {}
+    referenced_ids = set()
+    follower_ids = set()
+    n_docs, n_failed = 0, 0
+
+    def write(collection_name, docs):
+        nonlocal n_docs, n_failed
+        try:
+            _exporter.update_docs(collection_name, docs, raise_errors=True)
+        except Exception as ex:
+            n_failed += len(docs)
+            logger.exception(f"Failed to write {len(docs)} docs to {collection_name}: {ex}")
+            return
+        n_docs += len(docs)
+
+    def add(collection_name, docs):
+        buffer = buffers.setdefault(collection_name, [])
+        buffer.extend(docs)
+        if len(buffer) >= batch_size:
+            write(collection_name, buffer)
+            buffers[collection_name] = []
+
+    for path in paths:
+        for record in read_segment(path):
+            obj = record[RawPages.response]
+            if stream_type == Endpoints.followers:
+                users = list(parse_users(obj, -1))
+                fetched_at = record[RawPages.fetched_at]
+                add(MongoCollection.twitter_users,
+                    [TwitterProjectCrawlingJob.convert_user_to_dict(user) for user in users])
+                add(MongoCollection.twitter_user_count_logs, [
+                    TwitterProjectCrawlingJob.get_user_count_log(user, fetched_at) for user in users])
+                if follow_storage != "buckets":
+                    # Unfollows recorded after the archived page must survive the replay
+                    add(MongoCollection.twitter_follows, [
+                        TwitterProjectCrawlingJob.get_relationship(record[RawPages.user_id], user.id, refollow=False)
+                        for user in users])
+                follower_ids.update(user.id for user in users)
+            elif stream_type == Endpoints.user_tweets:
+                add(collection, TwitterProjectCrawlingJob.get_tweet_docs(list(parse_tweets(obj, -1)), referenced_ids))
+
+    for collection_name, buffer in buffers.items():
+        if buffer:
+            write(collection_name, buffer)
+    if follow_storage != "edges" and follower_ids:
+        # Pages only prove a follow, followers missing from the archive are kept
+        FollowBucketStore(_exporter, follow_bucket_size).add(user_id, follower_ids)
+    return n_docs, n_failed
+
+
+def _replay_segments(args):
+    try:
+        return f"{args[0]} {args[1]}", *replay_segments(*args), None
+    except Exception as ex:
+        return f"{args[0]} {args[1]}", 0, 0, ex
+
+
+class RawReplayJob:
+    """Re-run parsing and conversion of archived raw pages into mongo without calling twitter"""
+
+    def __init__(self, archive_path, connection_url, database, collection=MongoCollection.tweets,
+                 stream_types=None, user_ids=None, start_date=None, end_date=None, n_workers=None, batch_size=1000,
+                 follow_storage="edges", follow_bucket_size=50000):
+        """
+        Args:
+            * archive_path: root directory of the RawArchive
+            * stream_types, user_ids, start_date, end_date: filters of the replayed segments, dates are YYYY-MM-DD
+            * n_workers: number of worker processes, one per core by default
+            * batch_size: number of documents per mongo write
+            * follow_storage: edges, buckets or both, like the crawler option
+        """
+        self.archive = RawArchive(archive_path)
+        self.connection_url = connection_url
+        self.database = database
+        self.collection = collection
+        self.stream_types = stream_types
+        self.user_ids = user_ids
+        self.start_date = start_date
+        self.end_date = end_date
+        self.n_workers = n_workers or os.cpu_count()
+        self.batch_size = batch_size
+        self.follow_storage = follow_storage
+        self.follow_bucket_size = follow_bucket_size
+
+    def get_tasks(self, segments) -> list:
+        # The segments of a stream are replayed by one worker, follow buckets are read-modify-written
+        paths = {}
+        for stream_type, user_id, path in segments:
+            paths.setdefault((stream_type, user_id), []).append(path)
+        return [(stream_type, user_id, stream_paths, self.collection, self.batch_size, self.follow_storage,
+                 self.follow_bucket_size) for (stream_type, user_id), stream_paths in paths.items()]
+
+    def run(self):
+        begin = time.time()
+        segments = self.archive.list_segments(self.stream_types, self.user_ids, self.start_date, self.end_date)
+        tasks = self.get_tasks(segments)
+        logger.info(f"Replay {len(segments)} segments of {len(tasks)} streams with {self.n_workers} workers")
+        n_docs, n_failed_docs, n_failed = 0, 0, 0
+        with multiprocessing.Pool(self.n_workers, initializer=_init_worker,
+                                  initargs=(self.connection_url, self.database)) as pool:
+            results = pool.imap_unordered(_replay_segments, tasks)
+            for i, (stream, n_stream_docs, n_stream_failed, ex) in enumerate(results, 1):
+                if ex is not None:
+                    n_failed += 1
+                    logger.error(f"Failed to replay {stream}: {ex}")
+                n_docs += n_stream_docs
+                n_failed_docs += n_stream_failed
+                logger.info(f"[{i}/{len(tasks)}] Replayed {stream}: {n_stream_docs} docs, "
+                            f"{n_stream_failed} failed to be written")
+        logger.info(f"Replayed {n_docs} docs ({n_failed_docs} failed to be written) from {len(segments)} segments "
+                    f"of {len(tasks)} streams ({n_failed} failed) in {round(time.time() - begin, 3)}s")
@@ -0,0 +1,125 @@
+import asyncio
+import random
+import time
+
+from utils.logger_utils import get_logger
+from utils.time_utils import round_timestamp
+
+logger = get_logger('Scheduler Job')
+
+SLEEP_DURATION = 3
+
+
+class SchedulerJob:
+    """
+    Base for jobs that need to be run continually inside a single event loop.
+    Stream types are scheduled on their own interval, a stream type never overlaps with its previous run.
+    """
+
+    def __init__(self, interval=None, period=None, limit=None, end_timestamp=None, retry=True,
+                 stream_types=None, stream_intervals: dict = None, jitter=0):
+        """
+        Args:
+            * interval: Specify the default time interval between each run of a stream type
+            * end_timestamp: the timestamp that the job should stop. Left to 'None' if you don't want it to stop
+            * retry=True: Determine whether the function should retry if there is an error
+            * stream_types: stream types run by the job
+            * stream_intervals: {stream type: interval} overriding interval for some stream types
+            * jitter: max random seconds added to each scheduled time
+        """
+        self.interval = interval
+        self.period = period
+        self.limit = limit
+        self.end_timestamp = end_timestamp
+        self.stream_types = stream_types or []
+        self.stream_intervals = stream_intervals or {}
+        self.jitter = jitter
+
+        self.retry = retry
+
+    def run(self, *args, **kwargs):
+        asyncio.run(self._run(*args, **kwargs))
+
+    async def _run(self, *args, **kwargs):
+        await self._pre_start()
+        try:
+            await asyncio.gather(*[
+                self._schedule(interval, stream_types, *args, **kwargs)
+                for interval, stream_types in self._get_schedules().items()
+            ])
+        finally:
+            await self._follow_end()
+
+    def _get_schedules(self):
+        # Stream types sharing an interval run together
+        schedules = {}
+        for stream_type in self.stream_types:
+            interval = self.stream_intervals.get(stream_type, self.interval)
+            schedules.setdefault(interval, []).append(stream_type)
+        return schedules
+
+    async def _schedule(self, interval, stream_types, *args, **kwargs):
+        while True:
+            try:
+                await self._start()
+                await self._execute(stream_types, *args, **kwargs)
+            except Exception as ex:
+                logger.exception(ex)
+                logger.warning(f'Something went wrong with {stream_types}!!!')
+                if self.retry:
+                    await self._retry()
+                    continue
+
+            await self._end()
+
+            # Check if not repeat
+            if not interval:
+                break
+
+            # Check if finish
+            next_synced_timestamp = self._get_next_synced_timestamp(interval)
+            if self._check_finish(next_synced_timestamp):
+                break
+
+            # Sleep to next synced time
+            time_sleep = next_synced_timestamp - time.time() + random.uniform(0, self.jitter)
+            if time_sleep > 0:
+                logger.info(f'{stream_types}: sleep {round(time_sleep, 3)} seconds')
+                await asyncio.sleep(time_sleep)
+
+    @staticmethod
+    def _get_next_synced_timestamp(interval):
+        # Get the next execute timestamp, runs longer than interval skip the missed ones
+        return round_timestamp(int(time.time()), round_time=interval) + interval
+
+    async def _pre_start(self):
+        # Declare object variables and prepare data
+        pass
+
+    async def _start(self):
+        # Before execute
+        pass
+
+    async def _end(self):
+        # After execute
+        pass
+
+    async def _follow_end(self):
+        # End job, export results or close connections
+        pass
+
+    def _check_finish(self, next_synced_timestamp):
+        # Check if over end timestamp
+        if (self.end_timestamp is not None) and (next_synced_timestamp > self.end_timestamp):
+            return True
+
+        return False
+
+    async def _execute(self, stream_types, *args, **kwargs):
+        # Main execute handler
+        pass
+
+    async def _retry(self):
+        # Do before retry
+        logger.warning(f'Try again after {SLEEP_DURATION} seconds ...')
+        await asyncio.sleep(SLEEP_DURATION)
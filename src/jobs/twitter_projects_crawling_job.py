@@ -1,27 +1,55 @@
 import asyncio
+import os
+import socket
 import time
 import json
-from typing import AsyncGenerator, TypeVar
+from contextlib import aclosing
 
-import pycountry
+from twscrape import User, Tweet
 
-from twscrape import User, Tweet, gather
-
-from constants.config import AccountConfig
-from constants.mongo_constant import MongoCollection
+from constants.config import AccountConfig, CrawlerConfig
+from constants.mongo_constant import MongoCollection, MongoIndexes
 from constants.time_constant import TimeConstants
-from constants.twitter import TwitterUser, Follow, Tweets, Projects
+from constants.twitter import TwitterUser, Follow, Tweets, Projects, RateLimits, TwitterAccount, CrawlStates, \
+    CrawlTasks
+from src.crawler.account_pool import AccountManager
 from src.crawler.new_api import NewAPi
+from src.crawler.user_resolver import UserResolver
+from databases.buffered_sink import BufferedMongoSink
+from databases.change_detector import ChangeDetector, FingerprintCache
+from databases.crawl_state import CrawlState
+from databases.follow_buckets import FollowBucketStore
+from databases.follower_set import FollowerSetStore
 from databases.mongodb import MongoDB
-from src.jobs.cli_job import CLIJob
+from databases.raw_archive import RawArchive
+from databases.task_queue import MongoTaskQueue
+from databases.time_series import TimeSeriesBuckets
+from src.jobs.scheduler_job import SchedulerJob
+from utils.consistent_hash_utils import ConsistentHashRing
+from utils.country_utils import get_country_name
 from utils.logger_utils import get_logger
+from utils.metrics_utils import CONVERSION_SECONDS, QUEUE_DEPTH, start_metrics_server, write_metrics_textfile
+from utils.rate_limit_utils import RateLimiter
 from utils.time_utils import round_timestamp
 
-T = TypeVar("T")
 logger = get_logger('Twitter Project Crawling Job')
 
+# Consecutive already-stored tweets that end an incremental timeline crawl (pinned tweets are out of order)
+N_STORED_TWEETS_TO_STOP = 5
+# Share of followersCount a crawl must reach before missing followers are recorded as unfollows
+MIN_FOLLOWERS_COVERAGE = 0.9
+# Seconds to wait for the probe request before refreshing account sessions
+PROBE_TIMEOUT = 60
+
+# Seconds before a failed queue task is due again
+TASK_RETRY_DELAY = TimeConstants.MINUTES_15
+
+# Daily user counts bucketed per 30 days, per-run tweet impressions bucketed per day
+USER_COUNT_LOGS = TimeSeriesBuckets(MongoCollection.twitter_user_count_logs, TimeConstants.DAYS_30)
+TWEET_IMPRESSION_LOGS = TimeSeriesBuckets(MongoCollection.tweet_impression_logs, TimeConstants.A_DAY)
+
 
-class TwitterProjectCrawlingJob(CLIJob):
+class TwitterProjectCrawlingJob(SchedulerJob):
     def __init__(
             self,
             interval: int,
@@ -37,24 +65,111 @@ class TwitterProjectCrawlingJob(CLIJob):
             email_password: str = AccountConfig.EMAIL_PASSWORD,
             key: str = AccountConfig.KEY,
             session_id: str = 'twitter',
-            stream_types: list = ["projects", "tweets", "followers"]
+            stream_types: list = ["projects", "tweets", "followers"],
+            write_batch_size: int = 1000,
+            flush_interval: int = 5,
+            rate_limits: dict = None,
+            concurrency: int = 1,
+            accounts: list = None,
+            checkpoint_pages: int = 10,
+            follower_diff: bool = False,
+            follower_sets_path: str = CrawlerConfig.DATA_PATH + 'follower_sets',
+            profile_refresh_days: int = 1,
+            skip_unchanged: bool = False,
+            fingerprint_cache_path: str = None,
+            fingerprint_cache_size: int = 1000000,
+            handle_cache_ttl: int = TimeConstants.DAYS_7,
+            accounts_db: str = "accounts.db",
+            stream_intervals: dict = None,
+            jitter: int = 0,
+            shard_index: int = 0,
+            shard_count: int = 1,
+            lease_ttl: int = TimeConstants.A_HOUR,
+            use_queue: bool = False,
+            metrics_port: int = None,
+            metrics_file: str = None,
+            raw_archive_path: str = None,
+            raw_archive_compression: str = "gzip",
+            setup_indexes: bool = True,
+            logs_retention: int = None,
+            follow_storage: str = "edges",
+            follow_bucket_size: int = 50000
     ):
-        super().__init__(interval, period, limit, retry=False)
+        super().__init__(interval, period, limit, retry=False, stream_types=stream_types,
+                         stream_intervals=stream_intervals, jitter=jitter)
         self.period = period
         self.limit = limit
         self.collection = collection
-        self.stream_types = stream_types
         self.session_id = session_id
         self.key = key
         self.email_password = email_password
         self.email = email
         self.password = password
         self.user_name = user_name
+        self.accounts = accounts or [{
+            TwitterAccount.username: user_name,
+            TwitterAccount.password: password,
+            TwitterAccount.email: email,
+            TwitterAccount.email_password: email_password,
+        }]
+        self.accounts_db = accounts_db
         self.api = None
+        self.account_manager = None
+        self.setup_lock = None
         self.exporter = exporter
+        self.crawl_state = CrawlState(exporter)
+        self.write_batch_size = write_batch_size
+        self.flush_interval = flush_interval
+        self.sink = None
+        self.rate_limits = {**RateLimits.budgets, **(rate_limits or {})}
+        self.concurrency = concurrency
+        self.checkpoint_pages = checkpoint_pages
+        self.follower_diff = follower_diff
+        # edges: a twitter_follows doc per follow, buckets: packed follower ids per project, both: write both
+        self.write_edges = follow_storage != "buckets"
+        self.follow_buckets = FollowBucketStore(exporter, follow_bucket_size) if follow_storage != "edges" else None
+        # Buckets are rewritten from the full follower set, kept on disk across resumed crawls
+        self.follower_sets = None
+        if follower_diff or self.follow_buckets is not None:
+            self.follower_sets = FollowerSetStore(follower_sets_path)
+        self.profile_refresh_days = max(profile_refresh_days, 1)
+        self.handle_cache_ttl = handle_cache_ttl
+        self.change_detector = None
+        if skip_unchanged:
+            self.change_detector = ChangeDetector(
+                FingerprintCache(max_size=fingerprint_cache_size, path=fingerprint_cache_path),
+                collections=[MongoCollection.twitter_users, self.collection])
         self.projects = projects
         self.projects_file = self.load_projects_from_file(projects_file) if projects_file is not None else projects
 
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.lease_ttl = lease_ttl
+        self.lease_owner = f'{socket.gethostname()}:{os.getpid()}:{shard_index}'
+        self.metrics_port = metrics_port
+        self.metrics_file = metrics_file
+        self.setup_indexes = setup_indexes
+        self.logs_retention = logs_retention
+        self.archive = RawArchive(raw_archive_path, raw_archive_compression) if raw_archive_path else None
+        self.task_queue = MongoTaskQueue(exporter.mongo_db[MongoCollection.crawl_tasks]) if use_queue else None
+        if shard_count > 1:
+            self.projects_file, self.accounts = self.get_shard(self.projects_file, self.accounts)
+
+    def get_shard(self, projects: list, accounts: list):
+        """Projects and accounts of this shard, split by consistent hashing"""
+        ring = ConsistentHashRing(range(self.shard_count))
+        projects = [project for project in projects if ring.get_node(project) == self.shard_index]
+        shard_accounts = [
+            account for account in accounts
+            if ring.get_node(account[TwitterAccount.username]) == self.shard_index
+        ]
+        if not shard_accounts:
+            logger.warning(f"No account hashed to shard {self.shard_index}, using all accounts")
+            shard_accounts = accounts
+        logger.info(f"Shard {self.shard_index}/{self.shard_count}: {len(projects)} projects, "
+                    f"{len(shard_accounts)} accounts")
+        return projects, shard_accounts
+
     @staticmethod
     def load_projects_from_file(projects_file: str) -> list:
         with open(projects_file, 'r') as file:
@@ -63,13 +178,6 @@ class TwitterProjectCrawlingJob(CLIJob):
 
     @staticmethod
     def convert_user_to_dict(user: User) -> dict:
-        text = user.location
-        country_name = ""
-        for country in pycountry.countries:
-            if country.name.lower() in text.lower():
-                country_name = country.name
-                break
-
         return {
             TwitterUser.id_: str(user.id),
             TwitterUser.user_name: user.username,
@@ -92,20 +200,24 @@ class TwitterProjectCrawlingJob(CLIJob):
             TwitterUser.profile_banner_url: user.profileBannerUrl,
             TwitterUser.protected: user.protected,
             TwitterUser.location: user.location,
-            TwitterUser.country: country_name,
-            TwitterUser.count_logs: {
-                round_timestamp(time.time()): {
-                    TwitterUser.favourites_count: user.favouritesCount,
-                    TwitterUser.friends_count: user.friendsCount,
-                    TwitterUser.listed_count: user.listedCount,
-                    TwitterUser.media_count: user.mediaCount,
-                    TwitterUser.followers_count: user.followersCount,
-                    TwitterUser.statuses_count: user.statusesCount,
-                }
-            }
+            TwitterUser.country: get_country_name(user.location),
+            # Count history lives in USER_COUNT_LOGS, None unsets the logs kept by earlier versions
+            TwitterUser.count_logs: None,
         }
 
-    def convert_tweets_to_dict(self, tweet: Tweet) -> dict:
+    @staticmethod
+    def get_user_count_log(user: User, timestamp=None) -> dict:
+        return USER_COUNT_LOGS.to_bucket_doc(user.id, round_timestamp(timestamp or time.time()), {
+            TwitterUser.favourites_count: user.favouritesCount,
+            TwitterUser.friends_count: user.friendsCount,
+            TwitterUser.listed_count: user.listedCount,
+            TwitterUser.media_count: user.mediaCount,
+            TwitterUser.followers_count: user.followersCount,
+            TwitterUser.statuses_count: user.statusesCount,
+        })
+
+    @staticmethod
+    def convert_tweets_to_dict(tweet: Tweet) -> dict:
         if not tweet:
             return {}
         result = {
@@ -123,87 +235,463 @@ class TwitterProjectCrawlingJob(CLIJob):
             Tweets.hash_tags: tweet.hashtags,
             Tweets.reply_counts: tweet.replyCount,
             Tweets.retweet_counts: tweet.retweetCount,
-            Tweets.retweeted_tweet: self.convert_tweets_to_dict(tweet.retweetedTweet),
+            Tweets.retweeted_tweet_id: str(tweet.retweetedTweet.id) if tweet.retweetedTweet else None,
             Tweets.text: tweet.rawContent,
-            Tweets.quoted_tweet: self.convert_tweets_to_dict(tweet.quotedTweet),
+            Tweets.quoted_tweet_id: str(tweet.quotedTweet.id) if tweet.quotedTweet else None,
+            # Referenced tweets are stored on their own, None unsets the copies embedded by earlier versions
+            Tweets.retweeted_tweet: None,
+            Tweets.quoted_tweet: None,
+            # Impression history lives in TWEET_IMPRESSION_LOGS
+            Tweets.impression_logs: None,
         }
-        if time.time() - result.get(Tweets.timestamp) < self.period:
-            result[Tweets.impression_logs] = {
-                str(int(time.time())): {
-                    Tweets.views: tweet.viewCount,
-                    Tweets.likes: tweet.likeCount,
-                    Tweets.reply_counts: tweet.replyCount,
-                    Tweets.retweet_counts: tweet.retweetCount,
-                }
-            }
-
         return result
 
+    @classmethod
+    def get_tweet_docs(cls, tweets: list, written_ids: set = None) -> list:
+        """
+        Docs of tweets and of the tweets they retweet or quote, referenced tweets are stored on their own.
+        Args:
+            * written_ids: ids of referenced tweets already written, e.g. by previous pages. Updated in place
+        """
+        written_ids = set() if written_ids is None else written_ids
+        docs = {tweet.id: cls.convert_tweets_to_dict(tweet) for tweet in tweets}
+        referenced = [ref for tweet in tweets for ref in (tweet.retweetedTweet, tweet.quotedTweet) if ref]
+        while referenced:
+            tweet = referenced.pop()
+            if tweet.id in docs or tweet.id in written_ids:
+                continue
+            docs[tweet.id] = cls.convert_tweets_to_dict(tweet)
+            written_ids.add(tweet.id)
+            referenced.extend(ref for ref in (tweet.retweetedTweet, tweet.quotedTweet) if ref)
+        return list(docs.values())
+
+    def get_tweet_impression_logs(self, tweets: list) -> list:
+        # Impressions are only tracked for tweets younger than period
+        now = time.time()
+        return [TWEET_IMPRESSION_LOGS.to_bucket_doc(tweet.id, now, {
+            Tweets.views: tweet.viewCount,
+            Tweets.likes: tweet.likeCount,
+            Tweets.reply_counts: tweet.replyCount,
+            Tweets.retweet_counts: tweet.retweetCount,
+        }) for tweet in tweets if now - tweet.date.timestamp() < self.period]
+
     @staticmethod
-    def get_relationship(project, user):
-        return {
+    def get_relationship(project, user, refollow=True):
+        """Follow edge, with refollow the unfollowedAt of a previous unfollow is removed"""
+        relationship = {
             Follow.id_: f'{user}_{project}',
             Follow.from_: str(user),
-            Follow.to: str(project)
+            Follow.to: str(project),
+        }
+        if refollow:
+            relationship[Follow.unfollowed_at] = None
+        return relationship
+
+    def is_profile_due(self, user_id) -> bool:
+        # Spread profile refreshes of known followers evenly over profile_refresh_days
+        day = int(time.time() // TimeConstants.A_DAY)
+        return user_id % self.profile_refresh_days == day % self.profile_refresh_days
+
+    async def export_followers(self, project, users: list, previous_ids: set = None):
+        if previous_ids is None:
+            follows, profiles = users, users
+        else:
+            follows = [user for user in users if user.id not in previous_ids]
+            profiles = follows + [user for user in users if user.id in previous_ids and self.is_profile_due(user.id)]
+        with CONVERSION_SECONDS.labels("followers").time():
+            users_docs = [self.convert_user_to_dict(user) for user in profiles]
+            count_logs = [self.get_user_count_log(user) for user in profiles]
+            follows_docs = [self.get_relationship(project, user.id) for user in follows] if self.write_edges else []
+        await self.sink.put(MongoCollection.twitter_users, users_docs)
+        await self.sink.put(MongoCollection.twitter_user_count_logs, count_logs)
+        await self.sink.put(MongoCollection.twitter_follows, follows_docs)
+
+    async def export_unfollows(self, project, user_ids):
+        if not self.write_edges:
+            return
+        unfollowed_at = int(time.time())
+        await self.sink.put(MongoCollection.twitter_follows, [{
+            Follow.id_: f'{user_id}_{project}',
+            Follow.unfollowed_at: unfollowed_at
+        } for user_id in user_ids])
+
+    async def _pre_start(self):
+        # The sink, api and mongo client live as long as the job
+        self.setup_lock = asyncio.Lock()
+        if self.metrics_port:
+            start_metrics_server(self.metrics_port)
+        if self.setup_indexes:
+            await asyncio.to_thread(self.apply_indexes)
+        self.sink = BufferedMongoSink(
+            self.exporter, batch_size=self.write_batch_size, flush_interval=self.flush_interval,
+            change_detector=self.change_detector).start()
+
+    def apply_indexes(self):
+        """Create the indexes of MongoIndexes and warn about common queries that still scan a whole collection"""
+        for collection_name, indexes in MongoIndexes.specs.items():
+            indexes = list(indexes)
+            if self.logs_retention and collection_name in MongoIndexes.ttl:
+                name, field = MongoIndexes.ttl[collection_name]
+                indexes.append((name, [(field, 1)], {"expireAfterSeconds": self.logs_retention}))
+            try:
+                self.exporter.apply_indexes(self.get_collection_name(collection_name), indexes)
+            except Exception as ex:
+                logger.exception(f"Failed to create indexes of {collection_name}: {ex}")
+
+        for collection_name, queries in MongoIndexes.queries.items():
+            for filter_, sort in queries:
+                try:
+                    if not self.exporter.is_indexed_query(self.get_collection_name(collection_name), filter_, sort):
+                        logger.warning(f"Query {filter_} on {collection_name} does a collection scan")
+                except Exception as ex:
+                    logger.warning(f"Failed to explain {filter_} on {collection_name}: {ex}")
+
+    def get_collection_name(self, collection_name):
+        # Tweets go to the collection given to the job
+        return self.collection if collection_name == MongoCollection.tweets else collection_name
+
+    async def _follow_end(self):
+        await asyncio.to_thread(self.sink.close)
+        if self.archive is not None:
+            self.archive.close()
+        if self.change_detector is not None:
+            self.change_detector.close()
+
+    async def setup_api(self):
+        # The api and its account sessions (stored in accounts_db) are reused across runs and restarts
+        async with self.setup_lock:
+            if self.api is not None:
+                await self.account_manager.refresh_sessions()
+                return
+            await self._create_api()
+
+    async def _create_api(self):
+        self.api = NewAPi(self.accounts_db, rate_limiter=RateLimiter(self.rate_limits), archive=self.archive)
+        self.account_manager = AccountManager(self.api)
+        await self.account_manager.add_accounts(self.accounts)
+        # Budgets are per account, twscrape rotates requests over the active ones
+        n_accounts = await self.account_manager.count_active_accounts()
+        self.api.rate_limiter.scale(max(n_accounts, 1))
+        logger.info(f"Crawling with {n_accounts}/{len(self.accounts)} active accounts")
+
+    async def probe(self, user_resolver: UserResolver):
+        # The first lookup of the run doubles as a cheap session check
+        if not self.projects_file:
+            return
+        try:
+            user = await asyncio.wait_for(
+                user_resolver.get_user(self.get_handle(self.projects_file[0])), PROBE_TIMEOUT)
+        except asyncio.TimeoutError:
+            user = None
+        if user is None:
+            logger.warning("Probe request failed, refresh account sessions")
+            await self.api.pool.relogin_failed()
+
+    async def crawl(self, stream_types):
+        begin = time.time()
+        await self.setup_api()
+        api, account_manager = self.api, self.account_manager
+        user_resolver = UserResolver(api, self.exporter, self.handle_cache_ttl)
+        await self.probe(user_resolver)
+        logger.info(f"Ready to crawl {stream_types} in {round(time.time() - begin, 3)}s")
+
+        handlers = {
+            "projects": self.crawl_project_info,
+            "tweets": self.crawl_tweets,
+            "followers": self.crawl_followers,
         }
+        tasks = [
+            (stream_type, project)
+            for project in self.projects_file
+            for stream_type in handlers if stream_type in stream_types
+        ]
+        if self.task_queue is not None:
+            await self.crawl_queue(tasks, handlers, api, user_resolver, begin)
+        else:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            progress = {"done": 0, "failed": 0, "total": len(tasks)}
+            await asyncio.gather(*[
+                self.run_task(semaphore, progress, handlers[stream_type], api, user_resolver, stream_type, project)
+                for stream_type, project in tasks
+            ])
+            logger.info(f"Finished {progress['done']} tasks, {progress['failed']} failed")
+        user_resolver.log_stats()
+        api.rate_limiter.log_stats()
+        await account_manager.log_stats()
 
-    async def gather(self, gen: AsyncGenerator[T, None], project, time_sleep: int = 1, n_items: int = 1000) -> int:
-        tmp = 0
-        async for x in gen:
-            self.exporter.update_docs(MongoCollection.twitter_users, [self.convert_user_to_dict(x)])
-            self.exporter.update_docs(MongoCollection.twitter_follows, [self.get_relationship(project, x.id)])
-            tmp += 1
-            if tmp and not (tmp % n_items):
-                time.sleep(time_sleep)
-        return tmp
-
-    async def execute(self):
-        api = NewAPi()
-        await api.pool.add_account(
-            self.user_name,
-            self.password,
-            self.email,
-            self.email_password
-        )
-        await api.pool.login_all()
-        # for project in self.projects:
-        for project in self.projects_file:
+    async def run_task(self, semaphore, progress, handler, api, user_resolver, stream_type, project):
+        async with semaphore:
             begin = time.time()
-            # if project not in Projects.mapping:
-            #     continue
-
-            if "projects" in self.stream_types:
-                logger.info(f"Crawling {project} project info")
-                project_info = await api.user_by_login(Projects.mapping.get(project))
-                self.exporter.update_docs(MongoCollection.twitter_users, [self.convert_user_to_dict(project_info)])
-                logger.info(f"Crawl {project} projects info in {time.time() - begin}s")
-
-            if "tweets" in self.stream_types:
-                begin = time.time()
-                # logger.info(f"Crawling {project} tweets info")
-                project_info = await api.user_by_login(project)
-                if project_info is None:
-                    continue
-                if self.limit is None:
-                    # Get all tweet
-                    tweets = await gather(api.user_tweets(project_info.id, limit=project_info.statusesCount))
+            lease_key = f'lease_{stream_type}_{project}'
+            leased = False
+            try:
+                if self.shard_count > 1:
+                    # Never crawl a project stream that another worker is crawling
+                    if not await asyncio.to_thread(self.acquire_lease, lease_key):
+                        logger.info(f"Skip {project} {stream_type}, leased by another worker")
+                        return
+                    leased = True
+                    if not await self.run_with_lease(
+                            handler(api, user_resolver, project), lambda: self.acquire_lease(lease_key)):
+                        progress["failed"] += 1
+                        logger.warning(f"Lost lease {lease_key}, stopped crawling {project} {stream_type}")
                 else:
-                    tweets = await gather(api.user_tweets(project_info.id, limit=self.limit))
+                    await handler(api, user_resolver, project)
+            except Exception as ex:
+                progress["failed"] += 1
+                logger.exception(f"Failed to crawl {project} {stream_type}: {ex}")
+            finally:
+                if leased:
+                    await asyncio.to_thread(
+                        self.exporter.release_lease, MongoCollection.configs, lease_key, self.lease_owner)
+                progress["done"] += 1
+                logger.info(f"[{progress['done']}/{progress['total']}] Crawl {project} {stream_type} "
+                            f"in {round(time.time() - begin, 3)}s")
+
+    async def crawl_queue(self, tasks, handlers, api, user_resolver, run_begin):
+        """
+        Seed the queue with the tasks of this node, then work on any due task until none is left.
+        Args:
+            * run_begin: start of the scheduled run, finished tasks are due again at the next scheduled run
+        """
+        for stream_type, project in tasks:
+            await asyncio.to_thread(self.task_queue.enqueue, project, stream_type)
+        stream_types = list({stream_type for stream_type, _ in tasks})
+        progress = {"done": 0, "failed": 0}
+
+        async def worker():
+            while True:
+                task = await asyncio.to_thread(self.task_queue.claim, self.lease_owner, self.lease_ttl, stream_types)
+                n_due = await asyncio.to_thread(self.task_queue.count_due, stream_types)
+                QUEUE_DEPTH.labels('crawl_tasks').set(n_due)
+                if task is None:
+                    return
+                await self.run_queue_task(task, handlers, api, user_resolver, progress, run_begin)
+
+        await asyncio.gather(*[worker() for _ in range(self.concurrency)])
+        logger.info(f"Finished {progress['done']} queue tasks, {progress['failed']} failed")
+
+    async def run_queue_task(self, task, handlers, api, user_resolver, progress, run_begin):
+        task_id, project, stream_type = task[CrawlTasks.id_], task[CrawlTasks.project], task[CrawlTasks.stream_type]
+        begin = time.time()
+        try:
+            if not await self.run_with_lease(
+                    handlers[stream_type](api, user_resolver, project),
+                    lambda: self.task_queue.renew(task_id, self.lease_owner, self.lease_ttl)):
+                # Another node may own the task now, leave its state alone
+                progress["failed"] += 1
+                logger.warning(f"Lost lease of task {task_id}, stopped crawling {project} {stream_type}")
+                return
+            interval = self.stream_intervals.get(stream_type, self.interval)
+            # From the boundary the run was scheduled on, counting from now would skip the next run
+            next_due_at = round_timestamp(run_begin, round_time=interval) + interval if interval else None
+            await asyncio.to_thread(self.task_queue.complete, task_id, self.lease_owner, next_due_at)
+        except Exception as ex:
+            progress["failed"] += 1
+            logger.exception(f"Failed to crawl {project} {stream_type}: {ex}")
+            await asyncio.to_thread(self.task_queue.fail, task_id, self.lease_owner, ex, TASK_RETRY_DELAY)
+        finally:
+            progress["done"] += 1
+            logger.info(f"[{progress['done']}] Crawl {project} {stream_type} (attempt {task[CrawlTasks.attempts]}) "
+                        f"in {round(time.time() - begin, 3)}s")
+
+    async def run_with_lease(self, coro, renew_lease) -> bool:
+        """
+        Await coro while renew_lease() is called every lease_ttl / 3 seconds.
+        coro is cancelled as soon as a renewal fails, so two workers never crawl the same stream.
+        A renewal raising an error is retried until the lease would expire before the next one.
+        Returns False if the lease was lost.
+        """
+        crawl = asyncio.ensure_future(coro)
+        lease_lost = False
 
+        async def keep_lease():
+            nonlocal lease_lost
+            renewed_at = time.time()
+            while True:
+                await asyncio.sleep(self.lease_ttl / 3)
+                try:
+                    renewed = await asyncio.to_thread(renew_lease)
+                except Exception as ex:
+                    if time.time() + self.lease_ttl / 3 < renewed_at + self.lease_ttl:
+                        logger.warning(f"Failed to renew lease, retrying: {ex}")
+                        continue
+                    logger.exception(f"Failed to renew lease before it expires: {ex}")
+                    renewed = False
+                if not renewed:
+                    lease_lost = True
+                    crawl.cancel()
+                    return
+                renewed_at = time.time()
+
+        keeper = asyncio.create_task(keep_lease())
+        try:
+            await crawl
+        except asyncio.CancelledError:
+            if not lease_lost:
+                raise
+            return False
+        finally:
+            keeper.cancel()
+        return True
+
+    def acquire_lease(self, lease_key) -> bool:
+        return self.exporter.acquire_lease(MongoCollection.configs, lease_key, self.lease_owner, self.lease_ttl)
+
+    @staticmethod
+    def get_handle(project):
+        return Projects.mapping.get(project, project)
+
+    async def crawl_project_info(self, api, user_resolver, project):
+        project_info = await user_resolver.get_user(self.get_handle(project))
+        await self.sink.put(MongoCollection.twitter_users, [self.convert_user_to_dict(project_info)])
+        await self.sink.put(MongoCollection.twitter_user_count_logs, [self.get_user_count_log(project_info)])
+
+    async def crawl_tweets(self, api, user_resolver, project):
+        user_id = await user_resolver.get_user_id(self.get_handle(project))
+        if user_id is None:
+            return
+        state = await asyncio.to_thread(self.crawl_state.get, "tweets", user_id)
+        stored_tweet_id = int(state.get(CrawlStates.latest_tweet_id, 0))
+        stored_timestamp = state.get(CrawlStates.latest_timestamp)
+        latest_tweet_id = int(state.get(CrawlStates.pending_tweet_id) or stored_tweet_id)
+        latest_timestamp = state.get(CrawlStates.pending_timestamp) or stored_timestamp
+        cursor = state.get(CrawlStates.cursor)
+        # Get all tweet, or until the stored ones
+        limit = self.limit if self.limit is not None else -1
+        if cursor:
+            logger.info(f"Resume {project} tweets from checkpoint")
+
+        # Stop at stored tweets, but refresh the ones still tracked for impressions
+        refresh_from = stored_timestamp - self.period if stored_timestamp is not None else None
+        n_stored, n_pages = 0, 0
+        referenced_ids = set()
+        kv = {"cursor": cursor} if cursor else None
+        async with aclosing(api.user_tweets_pages(user_id, limit=limit, kv=kv)) as pages:
+            async for tweets, cursor in pages:
+                page, stop = [], False
                 for tweet in tweets:
-                    self.exporter.update_docs(self.collection, [self.convert_tweets_to_dict(tweet)])
+                    if tweet.id > stored_tweet_id:
+                        if tweet.id > latest_tweet_id:
+                            latest_tweet_id, latest_timestamp = tweet.id, tweet.date.timestamp()
+                    elif refresh_from is not None and tweet.date.timestamp() < refresh_from:
+                        n_stored += 1
+                        if n_stored >= N_STORED_TWEETS_TO_STOP:
+                            stop = True
+                            break
+                        continue
+                    n_stored = 0
+                    page.append(tweet)
+
+                with CONVERSION_SECONDS.labels("tweets").time():
+                    tweets_docs = self.get_tweet_docs(page, referenced_ids)
+                    impression_logs = self.get_tweet_impression_logs(page)
+                await self.sink.put(self.collection, tweets_docs)
+                await self.sink.put(MongoCollection.tweet_impression_logs, impression_logs)
+                n_pages += 1
+                if stop or not cursor:
+                    break
+                if not n_pages % self.checkpoint_pages:
+                    await self.checkpoint("tweets", user_id, {
+                        CrawlStates.cursor: cursor,
+                        CrawlStates.pending_tweet_id: str(latest_tweet_id),
+                        CrawlStates.pending_timestamp: latest_timestamp,
+                    })
+
+        await self.checkpoint("tweets", user_id, {
+            CrawlStates.cursor: None,
+            CrawlStates.pending_tweet_id: None,
+            CrawlStates.pending_timestamp: None,
+            CrawlStates.latest_tweet_id: str(latest_tweet_id),
+            CrawlStates.latest_timestamp: latest_timestamp,
+            CrawlStates.completed_at: int(time.time()),
+        })
+
+    async def checkpoint(self, stream_type, user_id, values: dict):
+        await asyncio.to_thread(self._checkpoint, stream_type, user_id, values)
+
+    def _checkpoint(self, stream_type, user_id, values: dict):
+        # Only move the cursor once everything crawled before it is written.
+        # Queue tasks resume from this state too, whichever node claims them
+        self.sink.flush()
+        self.crawl_state.update(stream_type, user_id, values)
+
+    async def crawl_followers(self, api, user_resolver, project):
+        follower_info = await user_resolver.get_user(self.get_handle(project))
+        state = await asyncio.to_thread(self.crawl_state.get, "followers", follower_info.id)
+        cursor = state.get(CrawlStates.cursor)
+        if cursor:
+            logger.info(f"Resume {project} followers from checkpoint")
+
+        previous_ids, seen_ids = None, set()
+        if self.follower_diff:
+            previous_ids = await asyncio.to_thread(self.follower_sets.load, follower_info.id)
+        if self.follower_sets is not None and cursor:
+            seen_ids = await asyncio.to_thread(self.follower_sets.load, follower_info.id, True)
+
+        n_pages = 0
+        kv = {"cursor": cursor} if cursor else None
+        async with aclosing(api.followers_pages(follower_info.id, kv=kv)) as pages:
+            async for users, cursor in pages:
+                await self.export_followers(follower_info.id, users, previous_ids)
+                seen_ids.update(user.id for user in users)
+                n_pages += 1
+                if not cursor:
+                    break
+                if not n_pages % self.checkpoint_pages:
+                    if self.follower_sets is not None:
+                        await asyncio.to_thread(self.follower_sets.save, follower_info.id, seen_ids, True)
+                    await self.checkpoint("followers", follower_info.id, {CrawlStates.cursor: cursor})
+
+        if self.follower_diff:
+            current_ids = await self.update_follower_set(follower_info, previous_ids, seen_ids)
+        elif self.follower_sets is not None:
+            current_ids = seen_ids
+            await asyncio.to_thread(self.follower_sets.discard_partial, follower_info.id)
+        if self.follow_buckets is not None:
+            await self.update_follow_buckets(follower_info, current_ids)
+        await self.checkpoint("followers", follower_info.id, {
+            CrawlStates.cursor: None,
+            CrawlStates.completed_at: int(time.time()),
+        })
 
-                # logger.info(f"Crawl {project} tweets info in {time.time() - begin}s")
-                logger.info(f"Crawled {self.projects_file.index(project) + 1}/{len(self.projects_file)} projects")
+    async def update_follow_buckets(self, follower_info: User, current_ids: set):
+        if not self.follower_diff and len(current_ids) < follower_info.followersCount * MIN_FOLLOWERS_COVERAGE:
+            # Partial crawl, keep the stored followers that were not reached
+            stored_ids = await asyncio.to_thread(self.follow_buckets.load, follower_info.id)
+            current_ids = current_ids | stored_ids
+        await asyncio.to_thread(self.follow_buckets.save, follower_info.id, current_ids)
 
-            if "followers" in self.stream_types:
-                logger.info(f"Crawling {project} followers info")
-                follower_info = await api.user_by_login(Projects.mapping.get(project))
-                await self.gather(api.followers(follower_info.id), follower_info.id, time_sleep=20)
-                logger.info(f"Crawl {project} followers info in {time.time() - begin}s")
+    async def update_follower_set(self, follower_info: User, previous_ids: set, seen_ids: set) -> set:
+        if len(seen_ids) >= follower_info.followersCount * MIN_FOLLOWERS_COVERAGE:
+            unfollowed_ids = previous_ids - seen_ids
+            await self.export_unfollows(follower_info.id, unfollowed_ids)
+            current_ids = seen_ids
+        else:
+            # The crawl stopped early, missing followers are not necessarily unfollows
+            logger.warning(f"Only got {len(seen_ids)}/{follower_info.followersCount} followers of "
+                           f"{follower_info.username}, skip unfollow detection")
+            unfollowed_ids = set()
+            current_ids = previous_ids | seen_ids
+        logger.info(f"{follower_info.username}: {len(seen_ids - previous_ids)} new followers, "
+                    f"{len(unfollowed_ids)} unfollows")
+        await asyncio.to_thread(self.follower_sets.save, follower_info.id, current_ids)
+        await asyncio.to_thread(self.follower_sets.discard_partial, follower_info.id)
+        return current_ids
 
-    def _execute(self, *args, **kwargs):
+    async def _execute(self, stream_types, *args, **kwargs):
         begin = time.time()
-        logger.info("Start execute twitter crawler")
-        asyncio.run(self.execute())
-        logger.info(f"Execute all streams in {time.time() - begin}s")
+        logger.info(f"Start execute twitter crawler {stream_types}")
+        await self.crawl(stream_types)
+        await asyncio.to_thread(self.sink.flush)
+        if self.archive is not None:
+            # Complete the segments written by this run, later pages reopen them
+            self.archive.close()
+        if self.change_detector is not None:
+            self.change_detector.cache.sync()
+            self.change_detector.log_stats()
+        write_stats = self.exporter.write_stats
+        logger.info(f"Planned {write_stats['field_ops']} field updates into {write_stats['planned_ops']} mongo ops")
+        if self.metrics_file:
+            write_metrics_textfile(self.metrics_file)
+        logger.info(f"Execute {stream_types} in {time.time() - begin}s")
@@ -0,0 +1,135 @@
+import pytest
+from pymongo import UpdateOne
+
+from databases.mongodb import MongoDB
+from utils.dict_utils import flatten_dict
+
+pytest.importorskip('pytest_benchmark')
+
+
+def flatten_dict_recursive(d):
+    # flatten_dict before it was made iterative, kept as the reference
+    out = {}
+    for key, val in d.items():
+        if isinstance(val, dict):
+            val = [val]
+        if isinstance(val, list):
+            array = []
+            for subdict in val:
+                if not isinstance(subdict, dict):
+                    array.append(subdict)
+                else:
+                    deeper = flatten_dict_recursive(subdict).items()
+                    out.update({str(key) + '.' + str(key2): val2 for key2, val2 in deeper})
+            if array:
+                out.update({str(key): array})
+        else:
+            out[str(key)] = val
+    return out
+
+
+def get_update_fields_flattened(document):
+    # get_update_fields before it was built in one pass, kept as the reference
+    fields = []
+    for key, value in flatten_dict(document).items():
+        if value is None:
+            fields.append(("$unset", key, ""))
+        elif isinstance(value, list):
+            fields.append(("$addToSet", key, {"$each": [i for i in value if i]}))
+        else:
+            fields.append(("$set", key, value))
+    return fields
+
+
+def get_user_doc(i=0):
+    # Shape of TwitterProjectCrawlingJob.convert_user_to_dict
+    return {
+        "_id": str(1000000 + i), "userName": f"user_{i}", "displayName": f"User {i}",
+        "url": f"https://twitter.com/user_{i}", "blue": False, "blueType": None,
+        "created": "2021-03-04 05:06:07+00:00", "timestamp": 1614834367,
+        "descriptionLinks": ["https://example.com", "https://t.me/example"],
+        "favouritesCount": 1520, "friendsCount": 312, "listedCount": 4, "mediaCount": 87,
+        "followersCount": 10234, "statusesCount": 4521, "rawDescription": "Builder. DeFi. " * 5,
+        "verified": False, "profileImageUrl": "https://pbs.twimg.com/profile_images/1/a.jpg",
+        "profileBannerUrl": "https://pbs.twimg.com/profile_banners/1/1", "protected": False,
+        "location": "Hanoi, Vietnam", "country": "Viet Nam",
+    }
+
+
+def get_tweet_doc(i=0):
+    # Shape of TwitterProjectCrawlingJob.convert_tweets_to_dict
+    return {
+        "_id": str(1700000000000000000 + i), "author": "1000000", "authorName": "user_0",
+        "created": "2024-01-02 03:04:05+00:00", "timestamp": 1704164645.0,
+        "url": f"https://twitter.com/user_0/status/{i}",
+        "userMentions": {str(2000000 + j): f"mention_{j}" for j in range(5)},
+        "views": 12034, "likes": 230, "hashTags": ["defi", "web3", "lending"],
+        "replyCounts": 12, "retweetCounts": 45, "retweetedTweetId": None,
+        "text": "Lending pools are live " * 8, "quotedTweetId": str(1600000000000000000 + i),
+    }
+
+
+DOCS = {
+    "users": [get_user_doc(i) for i in range(1000)],
+    "tweets": [get_tweet_doc(i) for i in range(1000)],
+}
+
+
+def build_operations(docs):
+    # update_docs: one merged UpdateOne per document
+    operations = []
+    for document in docs:
+        fields = [field for field in MongoDB.get_update_fields(document) if field[1] != "_id"]
+        operations += [UpdateOne({"_id": document["_id"]}, update, upsert=True)
+                       for update in MongoDB.plan_update_doc(fields)]
+    return operations
+
+
+def build_operations_per_field(docs):
+    # update_docs before the planner: one UpdateOne per field
+    operations = []
+    for document in docs:
+        for operator, items in zip(("$unset", "$set", "$addToSet"), MongoDB.create_update_doc(document)):
+            operations += [UpdateOne({"_id": item["_id"]},
+                                     {operator: {key: value for key, value in item.items() if key != "_id"}},
+                                     upsert=True)
+                           for item in items]
+    return operations
+
+
+@pytest.mark.parametrize('kind', DOCS)
+def test_flatten_iterative(benchmark, kind):
+    docs = DOCS[kind]
+    result = benchmark(lambda: [flatten_dict(doc) for doc in docs])
+    assert result == [flatten_dict_recursive(doc) for doc in docs]
+
+
+@pytest.mark.parametrize('kind', DOCS)
+def test_flatten_recursive(benchmark, kind):
+    docs = DOCS[kind]
+    benchmark(lambda: [flatten_dict_recursive(doc) for doc in docs])
+
+
+@pytest.mark.parametrize('kind', DOCS)
+def test_build_operations(benchmark, kind):
+    # The fields of a converted document never conflict
+    assert len(benchmark(build_operations, DOCS[kind])) == len(DOCS[kind])
+
+
+@pytest.mark.parametrize('kind', DOCS)
+def test_build_operations_per_field(benchmark, kind):
+    benchmark(build_operations_per_field, DOCS[kind])
+
+
+@pytest.mark.parametrize('kind', DOCS)
+def test_update_fields_one_pass(benchmark, kind):
+    docs = DOCS[kind]
+    result = benchmark(lambda: [MongoDB.get_update_fields(doc) for doc in docs])
+    assert [sorted(fields, key=str) for fields in result] == \
+        [sorted(get_update_fields_flattened(doc), key=str) for doc in docs]
+
+
+@pytest.mark.parametrize('kind', DOCS)
+def test_update_fields_flattened(benchmark, kind):
+    docs = DOCS[kind]
+    benchmark(lambda: [get_update_fields_flattened(doc) for doc in docs])
@@ -0,0 +1,56 @@
+import bson
+import pytest
+
+from constants.mongo_constant import MongoCollection
+from constants.twitter import Follow
+from databases.follow_buckets import FollowBucketStore
+from src.jobs.twitter_projects_crawling_job import TwitterProjectCrawlingJob
+
+pytest.importorskip('pytest_benchmark')
+
+PROJECT = "1300000000000000000"
+FOLLOWER_IDS = [1400000000000000000 + 7919 * i for i in range(20000)]
+
+
+@pytest.fixture
+def follows(exporter):
+    # The same followers as one document per edge and as packed buckets
+    # insert_many, mongomock upserts are quadratic in the collection size
+    exporter.mongo_db[MongoCollection.twitter_follows].insert_many([
+        TwitterProjectCrawlingJob.get_relationship(PROJECT, user_id, refollow=False) for user_id in FOLLOWER_IDS])
+    store = FollowBucketStore(exporter)
+    store.save(PROJECT, FOLLOWER_IDS)
+    return exporter.mongo_db[MongoCollection.twitter_follows], store
+
+
+def get_storage_size(docs) -> int:
+    return sum(len(bson.encode(doc)) for doc in docs)
+
+
+def scan_edges(collection):
+    return [int(doc[Follow.from_]) for doc in collection.find({Follow.to: PROJECT}, projection=[Follow.from_])]
+
+
+def test_save_buckets(benchmark, follows):
+    edges, store = follows
+    edges_size = get_storage_size(edges.find())
+    buckets_size = get_storage_size(store.collection.find())
+    # BSON size of the documents, before indexes and compression
+    benchmark.extra_info.update({"edges_bytes": edges_size, "buckets_bytes": buckets_size})
+    benchmark(store.save, PROJECT, FOLLOWER_IDS)
+    assert buckets_size * 5 < edges_size
+
+
+def test_scan_edges(benchmark, follows):
+    edges, _ = follows
+    assert len(benchmark(scan_edges, edges)) == len(FOLLOWER_IDS)
+
+
+def test_scan_buckets(benchmark, follows):
+    _, store = follows
+    assert len(benchmark(lambda: list(store.iter_followers(PROJECT)))) == len(FOLLOWER_IDS)
+
+
+def test_is_follower_buckets(benchmark, follows):
+    _, store = follows
+    assert benchmark(store.is_follower, PROJECT, FOLLOWER_IDS[len(FOLLOWER_IDS) // 2])
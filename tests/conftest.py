@@ -0,0 +1,30 @@
+import os
+
+import mongomock
+import pytest
+
+from databases import mongodb
+from databases.mongodb import MongoDB
+
+BENCHMARKS_PATH = os.path.join(os.path.dirname(__file__), 'benchmarks')
+
+
+def pytest_addoption(parser):
+    parser.addoption('--run-benchmarks', action='store_true', default=False,
+                     help='Run the pytest-benchmark suite of tests/benchmarks, skipped by default')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--run-benchmarks'):
+        return
+    skip = pytest.mark.skip(reason='benchmark, run with --run-benchmarks')
+    for item in items:
+        if str(item.fspath).startswith(BENCHMARKS_PATH):
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    """MongoDB backed by an in-memory mongomock client"""
+    monkeypatch.setattr(mongodb, 'MongoClient', mongomock.MongoClient)
+    return MongoDB(connection_url='mongodb://localhost:27017', database='test_database')
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+
+from databases.buffered_sink import BufferedMongoSink
+
+
+def test_flush_writes_partial_batch_without_waiting_for_interval(exporter):
+    with BufferedMongoSink(exporter, batch_size=1000, flush_interval=5) as sink:
+        sink.add('users', [{'_id': '1', 'name': 'a'}])
+        begin = time.time()
+        sink.flush()
+        assert time.time() - begin < 1
+        assert exporter.get_doc('users', key='1')['name'] == 'a'
+
+
+def test_flush_does_not_wait_for_docs_added_meanwhile(exporter):
+    stop = threading.Event()
+
+    def produce():
+        i = 0
+        while not stop.is_set():
+            sink.add('tweets', [{'_id': str(i), 'n': i}])
+            i += 1
+            time.sleep(0.005)
+
+    with BufferedMongoSink(exporter, batch_size=1000, flush_interval=60) as sink:
+        producer = threading.Thread(target=produce)
+        producer.start()
+        try:
+            time.sleep(0.05)
+            sink.add('users', [{'_id': '1', 'name': 'a'}])
+            begin = time.time()
+            sink.flush()
+            assert time.time() - begin < 1
+            assert exporter.get_doc('users', key='1')['name'] == 'a'
+            assert producer.is_alive()
+        finally:
+            stop.set()
+            producer.join()
+
+
+def test_close_drains_buffers(exporter):
+    sink = BufferedMongoSink(exporter, batch_size=1000, flush_interval=60).start()
+    sink.add('users', [{'_id': str(i), 'n': i} for i in range(10)])
+    sink.close()
+    assert exporter.mongo_db['users'].count_documents({}) == 10
+
+
+def test_put_waits_for_room_without_blocking_the_loop(exporter):
+    sink = BufferedMongoSink(exporter, batch_size=1000, flush_interval=60, max_buffered=2)
+
+    async def main():
+        ticks = []
+
+        async def ticker():
+            for _ in range(5):
+                ticks.append(time.time())
+                await asyncio.sleep(0.01)
+
+        await sink.put('users', [{'_id': '1', 'n': 1}, {'_id': '2', 'n': 2}])
+        # The sink is full until the worker is started and writes the first batch
+        tick = asyncio.create_task(ticker())
+        put = asyncio.create_task(sink.put('users', [{'_id': '3', 'n': 3}]))
+        await asyncio.sleep(0.1)
+        assert not put.done()
+        assert len(ticks) == 5
+        sink.start()
+        sink.flush()
+        await asyncio.wait_for(put, 5)
+        await tick
+
+    asyncio.run(main())
+    sink.close()
+    assert exporter.mongo_db['users'].count_documents({}) == 3
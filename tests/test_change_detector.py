@@ -0,0 +1,39 @@
+from databases.buffered_sink import BufferedMongoSink
+from databases.change_detector import ChangeDetector, FingerprintCache
+
+
+def get_detector():
+    return ChangeDetector(FingerprintCache(max_size=100), collections=['users'])
+
+
+def test_unchanged_docs_are_skipped_once_written(exporter):
+    detector = get_detector()
+    with BufferedMongoSink(exporter, change_detector=detector) as sink:
+        sink.add('users', [{'_id': '1', 'userName': 'a', 'followersCount': 10, 'countLogs': None}])
+        sink.flush()
+        sink.add('users', [{'_id': '1', 'userName': 'a', 'followersCount': 10, 'countLogs': None}])
+        sink.add('users', [{'_id': '1', 'userName': 'a', 'followersCount': 11, 'countLogs': None}])
+        sink.add('tweets', [{'_id': '2', 'views': 1}])
+        sink.flush()
+    assert detector.stats == {"checked": 3, "skipped": 1}
+    assert exporter.get_doc('users', key='1')['followersCount'] == 11
+    assert exporter.get_doc('tweets', key='2')['views'] == 1
+
+
+def test_failed_write_does_not_record_fingerprint(exporter, monkeypatch):
+    detector = get_detector()
+
+    def fail(col, bulk_operations):
+        raise RuntimeError('write failed')
+
+    with BufferedMongoSink(exporter, change_detector=detector) as sink:
+        monkeypatch.setattr(exporter, 'bulk_write', fail)
+        sink.add('users', [{'_id': '1', 'name': 'a'}])
+        sink.flush()
+        assert sink.stats["failed"] == 1
+
+        monkeypatch.undo()
+        sink.add('users', [{'_id': '1', 'name': 'a'}])
+        sink.flush()
+    assert detector.stats["skipped"] == 0
+    assert exporter.get_doc('users', key='1')['name'] == 'a'
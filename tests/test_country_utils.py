@@ -0,0 +1,28 @@
+import pytest
+
+from utils.country_utils import get_country_name
+
+
+@pytest.mark.parametrize('location, country', [
+    ("Hanoi, Vietnam", "Viet Nam"),
+    ("Lagos, Nigeria", "Nigeria"),
+    ("Berlin, DEU", "Germany"),
+    ("US", "United States"),
+    ("", ""),
+    # US states and abbreviations are not alpha-2 country codes inside a location
+    ("Los Angeles, CA", ""),
+    ("New Orleans, LA", ""),
+    ("Atlanta, GA", ""),
+    ("Chicago, IL", ""),
+    ("Web3 | AI", ""),
+    # Alpha-3 codes only count as the whole location or its last comma-separated part
+    ("DEU", "Germany"),
+    ("Toronto, CAN", "Canada"),
+    ("ETH", ""),
+    ("Building on ETH & BSC", ""),
+    ("WEB3 AND AI", ""),
+    ("CAN YOU SEE", ""),
+    ("PER ASPERA", ""),
+])
+def test_get_country_name(location, country):
+    assert get_country_name(location) == country
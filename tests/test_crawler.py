@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from src.crawler import crawler as crawler_module
+from src.crawler.crawler import Crawler
+
+
+class Response:
+    status_code = 200
+    content = b"img"
+
+    @staticmethod
+    def json():
+        return {"ok": True}
+
+
+class Session:
+    def __init__(self):
+        self.timeouts = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.timeouts.append(timeout)
+        return Response()
+
+
+def test_throttle_is_shared_by_threads():
+    crawler = Crawler(soup_calls_limit=10000, sleep_time=10000)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: crawler._throttle("https://example.com/page"), range(8000)))
+
+    bucket = crawler._buckets["https://example.com"]
+    assert len(crawler._buckets) == 1
+    assert 2000 <= bucket.tokens < 2001
+
+
+def test_request_is_not_throttled_and_images_use_the_timeout(monkeypatch):
+    session = Session()
+    monkeypatch.setattr(crawler_module, "get_session", lambda url: session)
+    crawler = Crawler(timeout=5)
+
+    assert crawler._request("https://example.com/api", lambda data: data) == {"ok": True}
+    assert crawler._buckets == {}
+    assert crawler.fetch_img("https://img.example.com/a.jpg") == b"img"
+    assert list(crawler._buckets) == ["https://img.example.com"]
+    assert Crawler.crawl_img("https://img.example.com/a.jpg") == b"img"
+    assert session.timeouts == [5, 5, 30]
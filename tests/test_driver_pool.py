@@ -0,0 +1,119 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from src.crawler.driver_pool import ChromeDriverPool, get_process_tree_rss
+
+
+class FakeDriver:
+    def __init__(self):
+        self.healthy = True
+        self.quit_calls = 0
+        self.urls = []
+
+    def execute_script(self, script):
+        if not self.healthy:
+            raise RuntimeError('chrome not reachable')
+        return 1
+
+    def get(self, url):
+        self.urls.append(url)
+
+    def quit(self):
+        self.quit_calls += 1
+
+
+def get_pool(**kwargs):
+    drivers = []
+
+    def create_driver():
+        drivers.append(FakeDriver())
+        return drivers[-1]
+
+    return ChromeDriverPool(create_driver, max_memory_mb=None, **kwargs), drivers
+
+
+def test_checkout_is_bounded_by_size():
+    pool, drivers = get_pool(size=2, checkout_timeout=0.1)
+    first, second = pool.checkout(), pool.checkout()
+    assert first is not second
+    with pytest.raises(TimeoutError):
+        pool.checkout()
+
+    pool.checkin(first)
+    assert pool.checkout() is first
+    assert len(drivers) == 2
+
+
+def test_drivers_are_recycled_after_max_pages():
+    pool, drivers = get_pool(size=1, max_pages=2)
+    for _ in range(3):
+        with pool.driver():
+            pass
+    assert len(drivers) == 2
+    assert drivers[0].quit_calls == 1
+    assert pool.stats["recycled"] == 1
+    assert pool.stats["pages"] == 3
+
+
+def test_unhealthy_drivers_are_replaced():
+    pool, drivers = get_pool(size=1)
+    with pool.driver():
+        pass
+    drivers[0].healthy = False
+
+    assert pool.checkout() is drivers[1]
+    assert drivers[0].quit_calls == 1
+    assert pool.stats == {"created": 2, "recycled": 0, "unhealthy": 1, "pages": 1}
+
+
+def test_close_quits_idle_and_returned_drivers():
+    pool, drivers = get_pool(size=2)
+    idle, busy = pool.checkout(), pool.checkout()
+    pool.checkin(idle)
+    pool.close()
+    assert idle.quit_calls == 1 and busy.quit_calls == 0
+
+    pool.checkin(busy)
+    assert busy.quit_calls == 1
+    with pytest.raises(RuntimeError):
+        pool.checkout()
+
+
+def test_map_keeps_url_order():
+    pool, drivers = get_pool(size=3)
+    urls = [f'https://example.com/{i}' for i in range(20)]
+    assert pool.map(urls, lambda driver: driver.urls[-1]) == urls
+    assert len(drivers) <= 3
+    assert pool.stats["pages"] == 20
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/task'), reason='needs /proc')
+def test_process_tree_rss_counts_children_of_other_threads():
+    children, started, done = [], threading.Event(), threading.Event()
+
+    def launch():
+        # The child holds about 64 MB, its launcher thread stays alive like chrome's
+        children.append(subprocess.Popen(
+            [sys.executable, '-c', "import sys; b = b'x' * 2 ** 26; print(1, flush=True); sys.stdin.read()"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE))
+        started.set()
+        done.wait()
+
+    thread = threading.Thread(target=launch)
+    thread.start()
+    started.wait()
+    child = children[0]
+    try:
+        child.stdout.readline()
+        with open('/proc/self/statm') as file:
+            own_rss = int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+        assert get_process_tree_rss(os.getpid()) - own_rss > 50
+    finally:
+        done.set()
+        thread.join()
+        child.stdin.close()
+        child.wait()
@@ -0,0 +1,45 @@
+import pytest
+
+from databases.follow_buckets import FollowBucketStore
+
+
+@pytest.fixture
+def store(exporter):
+    return FollowBucketStore(exporter, bucket_size=3)
+
+
+def test_save_round_trip_across_buckets(store):
+    ids = [7, 1, 42, 5, 3, 2**40, 11]
+    store.save("project", ids)
+
+    assert list(store.iter_followers("project")) == sorted(ids)
+    assert store.count("project") == len(ids)
+    assert store.collection.count_documents({"project": "project"}) == 3
+    for user_id in ids:
+        assert store.is_follower("project", user_id)
+    for user_id in [0, 4, 6, 12, 43, 2**40 + 1]:
+        assert not store.is_follower("project", user_id)
+    assert store.is_follower("project", str(42))
+
+
+def test_save_drops_buckets_of_a_larger_set(store):
+    store.save("project", range(10))
+    store.save("project", [4, 8])
+
+    assert list(store.iter_followers("project")) == [4, 8]
+    assert store.collection.count_documents({"project": "project"}) == 1
+    assert not store.is_follower("project", 9)
+
+    store.save("project", [])
+    assert store.count("project") == 0
+    assert not store.is_follower("project", 4)
+
+
+def test_add_merges_followers_and_keeps_projects_apart(store):
+    store.save("a", [1, 2, 3])
+    store.save("b", [2, 9])
+    store.add("a", [3, 4, 5])
+
+    assert store.load("a") == {1, 2, 3, 4, 5}
+    assert store.load("b") == {2, 9}
+    assert not store.is_follower("b", 1)
@@ -0,0 +1,40 @@
+from databases.mongodb import MongoDB
+
+
+def plan(document):
+    fields = [field for field in MongoDB.get_update_fields(document) if field[1] != "_id"]
+    return MongoDB.plan_update_doc(fields)
+
+
+def test_list_of_dicts_is_planned_like_create_update_doc():
+    document = {"_id": "1", "lst": [{"k": 1}, {"k": 2}]}
+    unset, set_, add_to_set = MongoDB.create_update_doc(document)
+    assert plan(document) == [{"$set": {"lst.k": 2}}]
+    assert set_[-1] == {"_id": "1", "lst.k": 2}
+
+
+def test_conflicting_paths_are_split():
+    updates = plan({"_id": "1", "a": None, "b": [1, None, 2], "c": {"d": 1}})
+    assert updates == [{"$unset": {"a": ""}, "$addToSet": {"b": {"$each": [1, 2]}}, "$set": {"c.d": 1}}]
+
+
+def test_update_docs_merges_sub_documents(exporter):
+    exporter.update_docs("users", [{"_id": "1", "logs": {"1": 1}}])
+    exporter.update_docs("users", [{"_id": "1", "logs": {"2": 2}, "name": "a"}])
+    assert exporter.get_doc("users", key="1") == {"_id": "1", "logs": {"1": 1, "2": 2}, "name": "a"}
+
+
+def test_update_fields_match_create_update_doc():
+    document = {"_id": "1", "a": None, "b": [1, None, {"c": 1}, {"c": None}], "d": {1: "x", "1": "y", "e": []},
+                "f": {"g": {"h": [2, 3]}}}
+    unset, set_, add_to_set = MongoDB.create_update_doc(document)
+    expected = {("$unset", key, value) for item in unset for key, value in item.items() if key != "_id"}
+    expected |= {("$set", key, value) for item in set_ for key, value in item.items() if key != "_id"}
+    expected |= {("$addToSet", key, str(value)) for item in add_to_set for key, value in item.items() if key != "_id"}
+    fields = MongoDB.get_update_fields(document)
+    assert {(operator, key, value if operator != "$addToSet" else str(value))
+            for operator, key, value in fields if key != "_id"} == expected
+    assert len({key for _, key, _ in fields}) == len(fields)
+
+    assert MongoDB.get_update_fields({"_id": "1", "a": None, "b": 1}, merge=False) == [
+        ("$unset", "a", ""), ("$set", "_id", "1"), ("$set", "b", 1)]
@@ -0,0 +1,41 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from constants.twitter import Endpoints, RawPages
+from src.jobs import raw_replay_job
+
+
+def get_tweet(tweet_id):
+    return SimpleNamespace(
+        id=tweet_id, user=SimpleNamespace(id=1, username="project"), date=datetime.fromtimestamp(0, timezone.utc),
+        url=f"https://twitter.com/project/status/{tweet_id}", mentionedUsers=[], viewCount=10, likeCount=1,
+        hashtags=[], replyCount=0, retweetCount=0, retweetedTweet=None, quotedTweet=None, rawContent="tweet")
+
+
+@pytest.fixture
+def replay(exporter, monkeypatch):
+    # One archived page per segment, each holding the tweets listed in its response
+    monkeypatch.setattr(raw_replay_job, "_exporter", exporter)
+    monkeypatch.setattr(raw_replay_job, "read_segment", lambda path: [{RawPages.response: path}])
+    monkeypatch.setattr(raw_replay_job, "parse_tweets", lambda obj, limit: [get_tweet(i) for i in obj])
+    return lambda paths: raw_replay_job.replay_segments(Endpoints.user_tweets, "1", paths, "tweets", batch_size=2)
+
+
+def test_replay_counts_written_docs(replay, exporter):
+    assert replay([[1, 2, 3], [4]]) == (4, 0)
+    assert exporter.mongo_db["tweets"].count_documents({}) == 4
+
+
+def test_replay_counts_failed_batches(replay, exporter, monkeypatch):
+    write = exporter.bulk_write
+
+    def bulk_write(col, operations):
+        if any(operation._filter["_id"] == "3" for operation in operations):
+            raise RuntimeError("write failed")
+        write(col, operations)
+
+    monkeypatch.setattr(exporter, "bulk_write", bulk_write)
+    # The first page is written as one batch of 3 docs
+    assert replay([[1, 2, 3], [4]]) == (1, 3)
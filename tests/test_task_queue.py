@@ -0,0 +1,19 @@
+from constants.mongo_constant import MongoCollection, MongoIndexes
+from databases.task_queue import MongoTaskQueue
+
+
+def test_claim_takes_the_due_task_with_the_highest_priority(exporter):
+    queue = MongoTaskQueue(exporter.mongo_db[MongoCollection.crawl_tasks])
+    queue.enqueue("a", "tweets", priority=0, next_due_at=0)
+    queue.enqueue("b", "tweets", priority=5, next_due_at=10)
+    queue.enqueue("c", "tweets", priority=9, next_due_at=2 ** 40)
+
+    assert queue.claim("node", 60)["project"] == "b"
+    assert queue.claim("node", 60)["project"] == "a"
+    assert queue.claim("node", 60) is None
+
+
+def test_claim_sort_is_served_by_the_registered_index():
+    (_, keys, _), = MongoIndexes.specs[MongoCollection.crawl_tasks]
+    (_, sort), = MongoIndexes.queries[MongoCollection.crawl_tasks]
+    assert keys == sort
@@ -0,0 +1,30 @@
+import time
+
+from databases.time_series import TimeSeriesBuckets
+
+DAY = 86400
+
+
+def test_get_range_across_buckets(exporter):
+    series = TimeSeriesBuckets("logs", bucket_size=DAY)
+    exporter.update_docs("logs", [series.to_bucket_doc("1", timestamp, {"n": i})
+                                  for i, timestamp in enumerate([DAY - 10, DAY + 10, 2 * DAY + 10, 3 * DAY + 10])])
+    exporter.update_docs("logs", [series.to_bucket_doc("2", DAY + 20, {"n": 9})])
+
+    assert exporter.mongo_db["logs"].count_documents({"key": "1"}) == 4
+    assert series.get_range(exporter, "1", DAY, 3 * DAY) == [(DAY + 10, {"n": 1}), (2 * DAY + 10, {"n": 2})]
+    assert series.get_range(exporter, "1", 0, 4 * DAY) == [
+        (DAY - 10, {"n": 0}), (DAY + 10, {"n": 1}), (2 * DAY + 10, {"n": 2}), (3 * DAY + 10, {"n": 3})]
+    assert series.get_range(exporter, "2", 0, 4 * DAY) == [(DAY + 20, {"n": 9})]
+
+
+def test_replayed_logs_do_not_move_expiry_back(exporter):
+    series = TimeSeriesBuckets("logs", bucket_size=DAY)
+    begin = int(time.time())
+    timestamp = begin // DAY * DAY + DAY // 2
+    exporter.update_docs("logs", [series.to_bucket_doc("1", timestamp, {"n": 2})])
+    exporter.update_docs("logs", [series.to_bucket_doc("1", timestamp - 60, {"n": 1})])
+
+    doc = exporter.mongo_db["logs"].find_one({"key": "1"})
+    assert doc["lastUpdatedAt"] >= begin
+    assert len(doc["logs"]) == 2
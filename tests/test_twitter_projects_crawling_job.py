@@ -0,0 +1,261 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from constants.mongo_constant import MongoCollection
+from databases.buffered_sink import BufferedMongoSink
+from src.jobs.twitter_projects_crawling_job import TwitterProjectCrawlingJob
+
+
+def get_tweet(tweet_id, retweeted=None, quoted=None, timestamp=1704164645):
+    # The twscrape Tweet attributes read by convert_tweets_to_dict
+    return SimpleNamespace(
+        id=tweet_id, user=SimpleNamespace(id=1, username="project"),
+        date=datetime.fromtimestamp(timestamp, timezone.utc),
+        url=f"https://twitter.com/project/status/{tweet_id}", mentionedUsers=[], viewCount=10, likeCount=1,
+        hashtags=[], replyCount=0, retweetCount=0, retweetedTweet=retweeted, quotedTweet=quoted,
+        rawContent=f"tweet {tweet_id}")
+
+
+@pytest.fixture
+def job(exporter):
+    return TwitterProjectCrawlingJob(
+        interval=3600, period=86400, limit=None, projects=["trava_finance"], projects_file=None,
+        exporter=exporter, collection=MongoCollection.tweets, stream_types=["tweets"], lease_ttl=0.03)
+
+
+def test_run_with_lease_cancels_the_crawl_when_the_lease_is_lost(job):
+    progress = []
+
+    async def crawl():
+        for i in range(100):
+            progress.append(i)
+            await asyncio.sleep(0.01)
+
+    assert asyncio.run(job.run_with_lease(crawl(), lambda: False)) is False
+    assert len(progress) < 10
+
+
+def test_run_with_lease_keeps_renewing(job):
+    renewals = []
+
+    async def crawl():
+        await asyncio.sleep(0.1)
+        return "done"
+
+    assert asyncio.run(job.run_with_lease(crawl(), lambda: renewals.append(1) or True)) is True
+    assert len(renewals) >= 2
+
+
+def test_run_with_lease_cancels_the_crawl_when_renewals_keep_failing(job):
+    progress = []
+
+    async def crawl():
+        for i in range(20):
+            progress.append(i)
+            await asyncio.sleep(0.01)
+
+    def renew():
+        raise ConnectionError("mongo is down")
+
+    assert asyncio.run(job.run_with_lease(crawl(), renew)) is False
+    assert len(progress) < 20
+
+
+def test_run_with_lease_retries_a_failed_renewal(job):
+    job.lease_ttl = 0.3
+    renewals = []
+
+    async def crawl():
+        await asyncio.sleep(0.5)
+        return "done"
+
+    def renew():
+        renewals.append(1)
+        if len(renewals) == 1:
+            raise ConnectionError("mongo is down")
+        return True
+
+    assert asyncio.run(job.run_with_lease(crawl(), renew)) is True
+    assert len(renewals) >= 3
+
+
+def test_queue_tasks_run_on_every_scheduled_cycle(exporter, monkeypatch):
+    interval = 3600
+    job = TwitterProjectCrawlingJob(
+        interval=interval, period=86400, limit=None, projects=["trava_finance"], projects_file=None,
+        exporter=exporter, collection=MongoCollection.tweets, stream_types=["tweets"], use_queue=True)
+    clock = [1700002800 + 5]
+    monkeypatch.setattr(time, 'time', lambda: clock[0])
+    crawled = []
+
+    async def crawl_tweets(api, user_resolver, project):
+        crawled.append((project, clock[0]))
+        # The crawl takes a while, the task finishes well after the scheduled boundary
+        clock[0] += 600
+
+    tasks = [("tweets", "trava_finance")]
+    handlers = {"tweets": crawl_tweets}
+    for _ in range(2):
+        run_begin = clock[0]
+        asyncio.run(job.crawl_queue(tasks, handlers, None, None, run_begin))
+        # Sleep until the next run like SchedulerJob does
+        clock[0] = job._get_next_synced_timestamp(interval)
+
+    assert [project for project, _ in crawled] == ["trava_finance", "trava_finance"]
+    assert crawled[1][1] - crawled[0][1] == interval - 5
+    task = exporter.get_doc(MongoCollection.crawl_tasks, key="tweets_trava_finance")
+    assert task["nextDueAt"] == 1700002800 + 2 * interval
+
+
+def test_replayed_follow_keeps_a_later_unfollow(exporter):
+    exporter.update_docs(MongoCollection.twitter_follows, [TwitterProjectCrawlingJob.get_relationship("1", "2")])
+    exporter.update_docs(MongoCollection.twitter_follows, [{"_id": "2_1", "unfollowedAt": 100}])
+
+    exporter.update_docs(MongoCollection.twitter_follows,
+                         [TwitterProjectCrawlingJob.get_relationship("1", "2", refollow=False)])
+    assert exporter.mongo_db[MongoCollection.twitter_follows].find_one({"_id": "2_1"})["unfollowedAt"] == 100
+
+    exporter.update_docs(MongoCollection.twitter_follows, [TwitterProjectCrawlingJob.get_relationship("1", "2")])
+    assert "unfollowedAt" not in exporter.mongo_db[MongoCollection.twitter_follows].find_one({"_id": "2_1"})
+
+
+def test_get_tweet_docs_stores_referenced_tweets_once():
+    written_ids = set()
+    # 13 quotes a retweet (12) of 11
+    quote = get_tweet(13, quoted=get_tweet(12, retweeted=get_tweet(11)))
+    docs = TwitterProjectCrawlingJob.get_tweet_docs([get_tweet(1, retweeted=get_tweet(11)), get_tweet(2, quoted=quote)],
+                                                    written_ids)
+
+    assert sorted(doc["_id"] for doc in docs) == ["1", "11", "12", "13", "2"]
+    assert written_ids == {11, 12, 13}
+    docs_by_id = {doc["_id"]: doc for doc in docs}
+    assert docs_by_id["2"]["quotedTweetId"] == "13"
+    assert docs_by_id["13"]["quotedTweetId"] == "12"
+    assert docs_by_id["12"]["retweetedTweetId"] == "11"
+
+    # The next page references tweets written by the previous one
+    docs = TwitterProjectCrawlingJob.get_tweet_docs([get_tweet(3, retweeted=get_tweet(11))], written_ids)
+    assert [doc["_id"] for doc in docs] == ["3"]
+
+
+def test_tweet_docs_unset_embedded_referenced_tweets(exporter):
+    exporter.update_docs(MongoCollection.tweets, [{"_id": "1", "text": "old", "retweetedTweet": {"id": "11"},
+                                                  "quotedTweet": {"id": "12"}}])
+    exporter.update_docs(MongoCollection.tweets, TwitterProjectCrawlingJob.get_tweet_docs([get_tweet(1)]))
+
+    doc = exporter.get_doc(MongoCollection.tweets, key="1")
+    assert doc["text"] == "tweet 1"
+    assert "retweetedTweet" not in doc and "quotedTweet" not in doc
+
+
+class FakeTweetsApi:
+    """user_tweets_pages over {cursor: (tweets, next cursor)}, the first page has the None cursor"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.served = []
+
+    async def user_tweets_pages(self, user_id, limit=-1, kv=None):
+        cursor = kv["cursor"] if kv else None
+        while True:
+            self.served.append(cursor)
+            tweets, cursor = self.pages[cursor]
+            yield tweets, cursor
+            if not cursor:
+                return
+
+
+def crawl_tweets(job, exporter, pages, state=None):
+    """Run crawl_tweets of user 1 over pages, returns the api, the stored tweet ids and the new crawl state"""
+    if state is not None:
+        job.crawl_state.update("tweets", 1, state)
+    api = FakeTweetsApi(pages)
+
+    async def get_user_id(handle):
+        return 1
+
+    async def main():
+        with BufferedMongoSink(exporter) as job.sink:
+            await job.crawl_tweets(api, SimpleNamespace(get_user_id=get_user_id), "project")
+
+    asyncio.run(main())
+    ids = sorted(int(doc["_id"]) for doc in exporter.mongo_db[MongoCollection.tweets].find())
+    return api, ids, job.crawl_state.get("tweets", 1)
+
+
+NOW = int(time.time())
+# Latest stored tweet, and tweets older than period before it
+OLD = NOW - 10 * 86400
+STALE = NOW - 30 * 86400
+
+
+def test_crawl_tweets_stops_after_stored_tweets(job, exporter):
+    pages = {
+        None: ([get_tweet(i, timestamp=NOW - 200 + i) for i in (105, 104)] +
+               [get_tweet(i, timestamp=STALE + i) for i in (100, 99, 98)], "c1"),
+        "c1": ([get_tweet(i, timestamp=STALE + i) for i in (97, 96, 95)], "c2"),
+        "c2": ([get_tweet(94, timestamp=STALE)], None),
+    }
+    api, ids, state = crawl_tweets(job, exporter, pages, {"latestTweetId": "100", "latestTimestamp": OLD})
+
+    # The 5th stored tweet in a row ends the crawl, the last page is never requested
+    assert api.served == [None, "c1"]
+    assert ids == [104, 105]
+    assert state["latestTweetId"] == "105" and state["cursor"] is None
+
+
+def test_crawl_tweets_goes_past_a_pinned_old_tweet(job, exporter):
+    pages = {None: ([get_tweet(50, timestamp=STALE)] + [get_tweet(i, timestamp=NOW - 200 + i) for i in (110, 109)] +
+                    [get_tweet(i, timestamp=STALE + i) for i in (100, 99, 98, 97, 96)], None)}
+    api, ids, state = crawl_tweets(job, exporter, pages, {"latestTweetId": "100", "latestTimestamp": OLD})
+
+    assert ids == [109, 110]
+    assert state["latestTweetId"] == "110"
+
+
+def test_crawl_tweets_refreshes_stored_tweets_within_period(job, exporter):
+    # Stored tweets younger than period before the latest stored one are written again
+    pages = {None: ([get_tweet(i, timestamp=NOW - 1000 + i) for i in (103, 102, 101, 100)] +
+                    [get_tweet(i, timestamp=STALE + i) for i in (90, 89, 88, 87, 86, 85)], None)}
+    api, ids, state = crawl_tweets(job, exporter, pages, {"latestTweetId": "101", "latestTimestamp": NOW - 899})
+
+    assert ids == [100, 101, 102, 103]
+    assert state["latestTweetId"] == "103"
+    assert exporter.mongo_db[MongoCollection.tweet_impression_logs].count_documents({}) == 4
+
+
+def test_crawl_tweets_resumes_from_checkpoint(job, exporter):
+    job.checkpoint_pages = 1
+    pages = {
+        None: ([get_tweet(130, timestamp=NOW - 70)], "c1"),
+        "c1": ([get_tweet(i, timestamp=NOW - 200 + i) for i in (115, 114)], "c2"),
+        "c2": ([get_tweet(113, timestamp=NOW - 200)], None),
+    }
+    # A previous run crawled up to c1 and saw tweet 120 before it stopped
+    api, ids, state = crawl_tweets(job, exporter, pages, {
+        "latestTweetId": "100", "latestTimestamp": OLD, "cursor": "c1", "pendingTweetId": "120",
+        "pendingTimestamp": NOW - 80})
+
+    assert api.served == ["c1", "c2"]
+    assert ids == [113, 114, 115]
+    assert state["latestTweetId"] == "120" and state["latestTimestamp"] == NOW - 80
+    assert state["cursor"] is None and state["pendingTweetId"] is None
+
+
+def test_crawl_tweets_checkpoints_pending_tweets(job, exporter, monkeypatch):
+    job.checkpoint_pages = 1
+    states = []
+    checkpoint = job._checkpoint
+    monkeypatch.setattr(job, "_checkpoint", lambda *args: states.append(args[2]) or checkpoint(*args))
+    pages = {
+        None: ([get_tweet(i, timestamp=NOW - 200 + i) for i in (105, 104)], "c1"),
+        "c1": ([get_tweet(103, timestamp=NOW - 200)], None),
+    }
+    crawl_tweets(job, exporter, pages)
+
+    assert states[0] == {"cursor": "c1", "pendingTweetId": "105", "pendingTimestamp": NOW - 95}
+    assert states[-1]["latestTweetId"] == "105"
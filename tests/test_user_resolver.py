@@ -0,0 +1,34 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.crawler.user_resolver import UserResolver
+
+
+class FakeApi:
+    def __init__(self):
+        self.calls = 0
+
+    async def user_by_login(self, handle):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(id=42, username=handle)
+
+
+def test_concurrent_lookups_share_one_api_call(exporter):
+    api = FakeApi()
+    resolver = UserResolver(api, exporter, ttl=3600)
+
+    async def main():
+        return await asyncio.gather(*[resolver.get_user('Trava_Finance') for _ in range(5)])
+
+    users = asyncio.run(main())
+    assert api.calls == 1
+    assert {user.id for user in users} == {42}
+
+
+def test_user_id_is_read_from_the_persisted_mapping(exporter):
+    asyncio.run(UserResolver(FakeApi(), exporter, ttl=3600).get_user('trava_finance'))
+    api = FakeApi()
+    resolver = UserResolver(api, exporter, ttl=3600)
+    assert asyncio.run(resolver.get_user_id('trava_finance')) == 42
+    assert api.calls == 0
@@ -0,0 +1,21 @@
+import bisect
+import hashlib
+
+
+def get_hash(key) -> int:
+    return int(hashlib.md5(str(key).encode()).hexdigest()[:16], 16)
+
+
+class ConsistentHashRing:
+    """Maps keys to nodes so that adding or removing a node only moves the keys of that node"""
+
+    def __init__(self, nodes, replicas=100):
+        self.replicas = replicas
+        self._ring = sorted((get_hash(f'{node}#{i}'), node) for node in nodes for i in range(replicas))
+        self._hashes = [hash_ for hash_, _ in self._ring]
+
+    def get_node(self, key):
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._hashes, get_hash(key)) % len(self._ring)
+        return self._ring[index][1]
@@ -0,0 +1,47 @@
+import functools
+import re
+
+import pycountry
+
+# Alpha-3 codes that are also words or crypto tickers ("ETH", "CAN YOU SEE"), only trusted after a comma
+AMBIGUOUS_ALPHA_3_CODES = {
+    "AND", "ARE", "ARM", "BEN", "BRA", "CAN", "COL", "CUB", "DOM", "ETH", "FIN", "GAB", "GIN", "GUM", "MAC",
+    "MAR", "PAN", "PER", "SUR", "TON", "TUN",
+}
+
+@functools.lru_cache(maxsize=None)
+def get_country_matchers():
+    """
+    Compile country names (case-insensitive substrings) once and index the alpha-3 and alpha-2 codes.
+    Codes are not searched inside the text: alpha-3 codes match the whole location or its last comma-separated part
+    ("Berlin, DEU"), alpha-2 codes clash with US states and common abbreviations (CA, LA, GA, IL, AI) and only match
+    a whole location.
+    """
+    names, codes, alpha_2_codes = {}, {}, {}
+    for country in pycountry.countries:
+        for name in (country.name, getattr(country, 'common_name', None), getattr(country, 'official_name', None)):
+            if name:
+                names.setdefault(name.lower(), country.name)
+        codes.setdefault(country.alpha_3, country.name)
+        alpha_2_codes.setdefault(country.alpha_2, country.name)
+
+    # Longest alternatives first so a name is never shadowed by a shorter one it contains (Niger/Nigeria)
+    name_pattern = re.compile('|'.join(re.escape(name) for name in sorted(names, key=len, reverse=True)))
+    return name_pattern, names, codes, alpha_2_codes
+
+
+@functools.lru_cache(maxsize=100000)
+def get_country_name(location: str) -> str:
+    if not location:
+        return ""
+    name_pattern, names, codes, alpha_2_codes = get_country_matchers()
+
+    matches = [match.group() for match in name_pattern.finditer(location.lower())]
+    if matches:
+        return names[max(matches, key=len)]
+
+    parts = location.split(',')
+    code = parts[-1].strip()
+    if code in codes and (len(parts) > 1 or code not in AMBIGUOUS_ALPHA_3_CODES):
+        return codes[code]
+    return alpha_2_codes.get(location.strip(), "")
@@ -3,22 +3,53 @@ import inspect
 
 
 def flatten_dict(d):
+    """
+    Flatten sub-dictionaries (also inside lists) into dotted paths, the non-dict items of a list are kept as one list.
+    Iterative, the last value wins for paths repeated by a list of dicts.
+    """
     out = {}
+    # Top level first without path building, most converted documents have no sub-dictionary
+    stack = []
     for key, val in d.items():
+        if type(key) is not str:
+            key = str(key)
         if isinstance(val, dict):
-            val = [val]
-        if isinstance(val, list):
+            stack.append((key, val))
+        elif isinstance(val, list):
             array = []
-            for subdict in val:
-                if not isinstance(subdict, dict):
-                    array.append(subdict)
+            for item in val:
+                if isinstance(item, dict):
+                    stack.append((key, item))
                 else:
-                    deeper = flatten_dict(subdict).items()
-                    out.update({str(key) + '.' + str(key2): val2 for key2, val2 in deeper})
+                    array.append(item)
             if array:
-                out.update({str(key): array})
+                out[key] = array
         else:
-            out[str(key)] = val
+            out[key] = val
+    # Reversed so sub-dictionaries are handled in document order
+    stack.reverse()
+    while stack:
+        prefix, current = stack.pop()
+        prefix += '.'
+        nested = []
+        for key, val in current.items():
+            path = prefix + (key if type(key) is str else str(key))
+            if isinstance(val, dict):
+                nested.append((path, val))
+            elif isinstance(val, list):
+                array = []
+                for item in val:
+                    if isinstance(item, dict):
+                        nested.append((path, item))
+                    else:
+                        array.append(item)
+                if array:
+                    out[path] = array
+            else:
+                out[path] = val
+        if nested:
+            nested.reverse()
+            stack += nested
     return out
 
 
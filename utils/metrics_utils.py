@@ -0,0 +1,37 @@
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, start_http_server, write_to_textfile
+
+from utils.file_utils import get_file_handle
+
+# Long-lived registry of the crawler, served over http or written as a textfile
+REGISTRY = CollectorRegistry()
+
+API_REQUESTS = Counter(
+    'twitter_api_requests', 'Twitter API requests (pages)', ['endpoint'], registry=REGISTRY)
+ACCOUNT_REQUESTS = Gauge(
+    'twitter_account_requests', 'Requests made by an account per twscrape queue', ['account', 'queue'],
+    registry=REGISTRY)
+ACCOUNT_ACTIVE = Gauge(
+    'twitter_account_active', 'Whether an account is active', ['account'], registry=REGISTRY)
+ITEMS = Counter(
+    'twitter_items', 'Items yielded by the API', ['endpoint'], registry=REGISTRY)
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    'rate_limit_wait_seconds', 'Time spent waiting for rate limit tokens', ['endpoint'], registry=REGISTRY)
+CONVERSION_SECONDS = Histogram(
+    'conversion_seconds', 'Time to convert a page of API objects to documents', ['stream_type'],
+    registry=REGISTRY)
+MONGO_BULK_WRITE_SECONDS = Histogram(
+    'mongo_bulk_write_seconds', 'Latency of mongo bulk writes', ['collection'], registry=REGISTRY)
+MONGO_BULK_WRITE_OPS = Counter(
+    'mongo_bulk_write_ops', 'Operations sent in mongo bulk writes', ['collection'], registry=REGISTRY)
+QUEUE_DEPTH = Gauge(
+    'crawler_queue_depth', 'Items waiting in a crawler queue', ['queue'], registry=REGISTRY)
+
+
+def start_metrics_server(port):
+    start_http_server(port, registry=REGISTRY)
+
+
+def write_metrics_textfile(path):
+    # Make sure the parent directory exists
+    get_file_handle(path, 'a').close()
+    write_to_textfile(path, REGISTRY)
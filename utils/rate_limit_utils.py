@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+from utils.logger_utils import get_logger
+from utils.metrics_utils import RATE_LIMIT_WAIT_SECONDS
+
+logger = get_logger('Rate Limiter')
+
+
+class TokenBucket:
+    """
+    Token bucket shared by coroutines of the same event loop.
+    Tokens are reserved up front (the balance may go negative), so waiters are served in FIFO order without a lock.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Take tokens and return the number of seconds to wait before using them"""
+        self._refill()
+        self.tokens -= tokens
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+    async def acquire(self, tokens: float = 1) -> float:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class RateLimiter:
+    """Per-endpoint token buckets with wait and throughput statistics"""
+
+    def __init__(self, budgets: dict = None):
+        """
+        Args:
+            * budgets: {endpoint: (rate per second, burst capacity)}. Endpoints without a budget are not limited
+        """
+        self.buckets = {}
+        self.stats = {}
+        self.started_at = time.time()
+        for endpoint, (rate, capacity) in (budgets or {}).items():
+            self.set_budget(endpoint, rate, capacity)
+
+    def set_budget(self, endpoint, rate, capacity=None):
+        self.buckets[endpoint] = TokenBucket(rate, capacity)
+
+    def scale(self, factor):
+        # Scale every budget, e.g. by the number of usable accounts
+        for bucket in self.buckets.values():
+            bucket.rate *= factor
+            bucket.capacity *= factor
+
+    async def acquire(self, endpoint, tokens: float = 1) -> float:
+        bucket = self.buckets.get(endpoint)
+        wait = await bucket.acquire(tokens) if bucket is not None else 0
+        stats = self.stats.setdefault(endpoint, {"acquired": 0, "waits": 0, "wait_seconds": 0})
+        stats["acquired"] += tokens
+        if wait > 0:
+            stats["waits"] += 1
+            stats["wait_seconds"] += wait
+            RATE_LIMIT_WAIT_SECONDS.labels(endpoint).observe(wait)
+        return wait
+
+    def get_stats(self) -> dict:
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        return {
+            endpoint: {**stats, "throughput": stats["acquired"] / elapsed}
+            for endpoint, stats in self.stats.items()
+        }
+
+    def log_stats(self):
+        for endpoint, stats in self.get_stats().items():
+            logger.info(f"[{endpoint}] {stats['acquired']} items, {round(stats['throughput'], 2)} items/s, "
+                        f"waited {stats['waits']} times for {round(stats['wait_seconds'], 3)}s")
+
+
+def parse_budgets(values) -> dict:
+    """Parse 'endpoint=rate[:capacity]' strings into RateLimiter budgets"""
+    budgets = {}
+    for value in values or []:
+        endpoint, budget = value.split('=', 1)
+        rate, _, capacity = budget.partition(':')
+        budgets[endpoint.strip()] = (float(rate), float(capacity) if capacity else None)
+    return budgets